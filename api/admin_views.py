@@ -6,30 +6,35 @@ from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
 from .models import User, Post, Comment, Like, Bookmark, SiteSettings
-from .serializers import UserSerializer, PostSerializer, CommentSerializer, SiteSettingsSerializer
+from .serializers import (UserSerializer, PostSerializer, CommentSerializer,
+                          SiteSettingsSerializer, UserActivitySerializer)
+from .pagination import KeysetPagination
+from .follow_graph import follow_graph
+from .fragment_cache import fragment_cache
+from . import analytics, events, exports
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_stats(request):
     """Get admin dashboard statistics"""
-    now = timezone.now()
-    last_month = now - timedelta(days=30)
+    today = timezone.localdate()
 
-    # Get current counts
-    users_count = User.objects.count()
-    posts_count = Post.objects.count()
-    comments_count = Comment.objects.count()
+    # Get current counts (from the daily rollups plus rows created since)
+    totals = analytics.totals()
+    users_count = totals['signups']
+    posts_count = totals['posts']
+    comments_count = totals['comments']
 
     # Get last month's counts for trend calculation
-    last_month_users = User.objects.filter(date_joined__lt=last_month).count()
-    last_month_posts = Post.objects.filter(created_at__lt=last_month).count()
-    last_month_comments = Comment.objects.filter(
-        created_at__lt=last_month).count()
+    last_month = analytics.totals(today - timedelta(days=30))
+    last_month_users = last_month['signups']
+    last_month_posts = last_month['posts']
+    last_month_comments = last_month['comments']
 
     # Calculate engagement (likes + comments + bookmarks per post)
-    total_interactions = Like.objects.count() + Comment.objects.count() + \
-        Bookmark.objects.count()
+    total_interactions = totals['likes'] + totals['comments'] + \
+        totals['bookmarks']
     engagement_rate = (total_interactions / posts_count *
                        100) if posts_count > 0 else 0
 
@@ -108,15 +113,46 @@ def admin_activity(request):
     return Response(activity[:10])  # Return only the 10 most recent activities
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def admin_events(request):
+    """
+    Tail of the activity event log, newest first. ``?user=<id>`` narrows it
+    to one user, ``?type=login,post`` to some event types and
+    ``?days=<n>`` to recent partitions.
+    """
+    user = request.query_params.get('user')
+    days = request.query_params.get('days')
+    if user is not None and not user.isdigit():
+        return Response({'error': 'user must be a user ID'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if days is not None and not days.isdigit():
+        return Response({'error': 'days must be a whole number'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    types = [name.strip() for name in
+             request.query_params.get('type', '').split(',') if name.strip()]
+    log = events.tail(
+        user=int(user) if user is not None else None, types=types,
+        since=timezone.now() - timedelta(days=int(days)) if days else None)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(log, request)
+    serializer = UserActivitySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_users(request, user_id=None):
     """Manage users from admin dashboard"""
     if request.method == 'GET':
         users = User.objects.all()
+        if exports.requested_format(request):
+            return exports.stream(request, users, UserSerializer, 'users')
+        paginator = KeysetPagination(ordering=('-date_joined', '-id'))
+        page = paginator.paginate_queryset(users, request)
         serializer = UserSerializer(
-            users, many=True, context={'request': request})
-        return Response(serializer.data)
+            page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     elif request.method == 'PUT':
         user = User.objects.get(id=user_id)
@@ -136,20 +172,36 @@ def admin_users(request, user_id=None):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_posts(request):
-    """Get all posts with admin details"""
-    posts = Post.objects.all().order_by('-created_at')
-    serializer = PostSerializer(posts, many=True, context={'request': request})
-    return Response(serializer.data)
+    """Get all posts with admin details (``?export=jsonl|json`` streams all)"""
+    posts = Post.objects.with_author()
+    if exports.requested_format(request):
+        return exports.stream(request, posts, PostSerializer, 'posts')
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(posts, request)
+    serializer = PostSerializer(page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_comments(request):
-    """Get all comments with admin details"""
-    comments = Comment.objects.all().order_by('-created_at')
+    """Get all comments with admin details (``?export=jsonl|json`` streams all)"""
+    comments = Comment.objects.with_author()
+    if exports.requested_format(request):
+        return exports.stream(request, comments, CommentSerializer, 'comments')
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(comments, request)
     serializer = CommentSerializer(
-        comments, many=True, context={'request': request})
-    return Response(serializer.data)
+        page, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def admin_cache_stats(request):
+    """Get fragment cache hit ratio and follow graph cache size for this worker"""
+    return Response({**fragment_cache.stats(),
+                     'follow_graph': follow_graph.stats()})
 
 
 @api_view(['GET', 'PUT'])
@@ -208,78 +260,20 @@ def update_user_role(request, user_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_analytics(request):
-    """Get time-series analytics data for charts"""
-    time_range = request.GET.get('range', 'week')
-    now = timezone.now()
-
-    if time_range == 'week':
-        days = 7
-        interval = 'day'
-    elif time_range == 'month':
-        days = 30
-        interval = 'day'
-    else:  # year
-        days = 365
-        interval = 'month'
-
-    start_date = now - timedelta(days=days)
-
-    # Generate date ranges
-    if interval == 'day':
-        dates = [(start_date + timedelta(days=x)).strftime('%Y-%m-%d')
-                 for x in range(days)]
-    else:
-        dates = [(start_date + timedelta(days=x*30)).strftime('%Y-%m')
-                 for x in range(12)]
-
-    # Get user signups over time
-    user_data = []
-    for date in dates:
-        if interval == 'day':
-            count = User.objects.filter(
-                date_joined__date=date
-            ).count()
-        else:
-            count = User.objects.filter(
-                date_joined__year=date.split('-')[0],
-                date_joined__month=date.split('-')[1]
-            ).count()
-        user_data.append(count)
-
-    # Get post creation data
-    post_data = []
-    for date in dates:
-        if interval == 'day':
-            count = Post.objects.filter(
-                created_at__date=date
-            ).count()
-        else:
-            count = Post.objects.filter(
-                created_at__year=date.split('-')[0],
-                created_at__month=date.split('-')[1]
-            ).count()
-        post_data.append(count)
-
-    # Get engagement data (likes + comments)
-    engagement_data = []
-    for date in dates:
-        if interval == 'day':
-            likes = Like.objects.filter(created_at__date=date).count()
-            comments = Comment.objects.filter(created_at__date=date).count()
-        else:
-            likes = Like.objects.filter(
-                created_at__year=date.split('-')[0],
-                created_at__month=date.split('-')[1]
-            ).count()
-            comments = Comment.objects.filter(
-                created_at__year=date.split('-')[0],
-                created_at__month=date.split('-')[1]
-            ).count()
-        engagement_data.append(likes + comments)
+    """
+    Get time-series analytics data for charts.
+
+    ``range`` (week, month or year) picks a preset; ``start``, ``end`` and
+    ``interval`` (day, week or month) override it.
+    """
+    buckets, interval = analytics.resolve_range(request.GET)
+    series = analytics.bucket_series(buckets, interval)
 
     return Response({
-        'dates': dates,
-        'users': user_data,
-        'posts': post_data,
-        'engagement': engagement_data
+        'interval': interval,
+        'dates': analytics.labels(buckets, interval),
+        'users': series['signups'],
+        'posts': series['posts'],
+        'engagement': [likes + comments for likes, comments
+                       in zip(series['likes'], series['comments'])],
     })
@@ -0,0 +1,223 @@
+"""
+Time series and totals for the admin dashboard.
+
+Finished days are read from ``DailyRollup`` (filled by ``manage.py
+rollup_daily_stats``), so the dashboard reads a few hundred small rows no
+matter how big the tables are. Days after the last rollup, normally just
+today, are counted live with one ``GROUP BY`` per metric over the indexed
+timestamp; buckets without rows are filled with zero in Python.
+
+Each rollup also stores the totals existing at the end of its day, so
+``totals`` adds the rows created since the last rollup to those. The
+per-day counts are not revised when rows are deleted later, but every
+rollup takes fresh totals, so a deletion is reflected within a day.
+"""
+import datetime
+
+from django.db.models import Count, DateField, Max
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+
+from .models import Bookmark, Comment, DailyRollup, Like, Post, User
+
+# DailyRollup field -> (model, timestamp field) it counts
+METRICS = {
+    'signups': (User, 'date_joined'),
+    'posts': (Post, 'created_at'),
+    'comments': (Comment, 'created_at'),
+    'likes': (Like, 'created_at'),
+    'bookmarks': (Bookmark, 'created_at'),
+}
+
+INTERVALS = ('day', 'week', 'month')
+LABEL_FORMATS = {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m'}
+MAX_BUCKETS = 1000
+
+# range -> (buckets shown, interval) when no explicit start is given
+RANGES = {
+    'week': (7, 'day'),
+    'month': (30, 'day'),
+    'year': (12, 'month'),
+}
+
+
+def bucket_start(day, interval):
+    if interval == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, interval):
+    if interval == 'day':
+        return day + datetime.timedelta(days=1)
+    if interval == 'week':
+        return day + datetime.timedelta(days=7)
+    return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def previous_bucket(day, interval):
+    if interval == 'month':
+        return (day - datetime.timedelta(days=1)).replace(day=1)
+    return day - datetime.timedelta(days=1 if interval == 'day' else 7)
+
+
+def _parse_date(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValidationError({name: 'Expected a date as YYYY-MM-DD'})
+    return day
+
+
+def resolve_range(params):
+    """
+    The ``(buckets, interval)`` asked for by ``start``/``end``/``interval``
+    query parameters, defaulting to the legacy ``range`` presets. Buckets
+    are the start dates of every interval from ``start`` to ``end``.
+    """
+    # Like before, an unknown range means a year
+    count, interval = RANGES.get(params.get('range', 'week'), RANGES['year'])
+    interval = params.get('interval', interval)
+    if interval not in INTERVALS:
+        raise ValidationError(
+            {'interval': f"Expected one of {', '.join(INTERVALS)}"})
+
+    end = _parse_date(params, 'end') or timezone.localdate()
+    start = _parse_date(params, 'start')
+    if start is None:
+        start = bucket_start(end, interval)
+        for _ in range(count - 1):
+            start = previous_bucket(start, interval)
+    if start > end:
+        raise ValidationError({'start': 'Must not be after end'})
+
+    buckets = []
+    day = bucket_start(start, interval)
+    while day <= end:
+        if len(buckets) == MAX_BUCKETS:
+            raise ValidationError(
+                {'interval': f'Range spans more than {MAX_BUCKETS} buckets'})
+        buckets.append(day)
+        day = next_bucket(day, interval)
+    return buckets, interval
+
+
+def _as_datetime(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def count_series(queryset, field, buckets, interval):
+    """Rows of ``queryset`` per bucket of ``field``, in one query."""
+    since = _as_datetime(buckets[0])
+    until = _as_datetime(next_bucket(buckets[-1], interval))
+    rows = (queryset.order_by()
+            .filter(**{f'{field}__gte': since, f'{field}__lt': until})
+            .annotate(bucket=Trunc(field, interval, output_field=DateField()))
+            .values('bucket')
+            .annotate(total=Count('*'))
+            .values_list('bucket', 'total'))
+    counts = dict(rows)
+    return [counts.get(bucket, 0) for bucket in buckets]
+
+
+def labels(buckets, interval):
+    return [bucket.strftime(LABEL_FORMATS[interval]) for bucket in buckets]
+
+
+def days_between(first, last):
+    return [first + datetime.timedelta(days=n)
+            for n in range((last - first).days + 1)]
+
+
+def rolled_up_until():
+    """The last day stored in ``DailyRollup``, or None."""
+    return DailyRollup.objects.aggregate(last=Max('date'))['last']
+
+
+def live_daily_counts(first, last):
+    """``{metric: [count per day]}`` from ``first`` to ``last``, counted live."""
+    days = days_between(first, last)
+    return {metric: count_series(model.objects.all(), field, days, 'day')
+            for metric, (model, field) in METRICS.items()}
+
+
+def daily_counts(first, last):
+    """
+    ``{metric: {day: count}}`` from ``first`` to ``last``: rolled-up days
+    from ``DailyRollup``, later ones live.
+    """
+    counts = {metric: {} for metric in METRICS}
+    until = rolled_up_until()
+    if until is not None and until >= first:
+        rows = DailyRollup.objects.filter(
+            date__gte=first, date__lte=min(until, last),
+        ).values('date', *METRICS)
+        for row in rows:
+            for metric in METRICS:
+                counts[metric][row['date']] = row[metric]
+
+    live_from = first if until is None else max(first, until + datetime.timedelta(days=1))
+    if live_from <= last:
+        days = days_between(live_from, last)
+        for metric, series in live_daily_counts(live_from, last).items():
+            counts[metric].update(zip(days, series))
+    return counts
+
+
+def bucket_series(buckets, interval):
+    """``{metric: [count per bucket]}`` for buckets from ``resolve_range``."""
+    last = next_bucket(buckets[-1], interval) - datetime.timedelta(days=1)
+    counts = daily_counts(buckets[0], last)
+    index = {bucket: position for position, bucket in enumerate(buckets)}
+    series = {}
+    for metric, per_day in counts.items():
+        totals = [0] * len(buckets)
+        for day, count in per_day.items():
+            totals[index[bucket_start(day, interval)]] += count
+        series[metric] = totals
+    return series
+
+
+def live_totals(since=None, until=None):
+    """
+    ``{metric: count}`` of existing rows created on or after the day
+    ``since`` and before the day ``until`` (None leaves that end open).
+    """
+    result = {}
+    for metric, (model, field) in METRICS.items():
+        rows = model.objects.all()
+        if since is not None:
+            rows = rows.filter(**{f'{field}__gte': _as_datetime(since)})
+        if until is not None:
+            rows = rows.filter(**{f'{field}__lt': _as_datetime(until)})
+        result[metric] = rows.count()
+    return result
+
+
+def totals(day=None):
+    """
+    ``{metric: count}`` of the rows that exist at the end of ``day``
+    (default: now): the totals stored by the last rollup up to then plus
+    the rows created after it, counted over the indexed timestamps.
+    """
+    rollups = DailyRollup.objects.order_by('-date')
+    if day is not None:
+        rollups = rollups.filter(date__lte=day)
+    rollup = rollups.first()
+    one_day = datetime.timedelta(days=1)
+    result = live_totals(
+        since=None if rollup is None else rollup.date + one_day,
+        until=None if day is None else day + one_day)
+    if rollup is not None:
+        for metric in METRICS:
+            result[metric] += getattr(rollup, f'{metric}_total')
+    return result
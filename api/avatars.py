@@ -0,0 +1,108 @@
+"""
+Avatar size variants.
+
+Every uploaded avatar is kept as the original plus a square thumbnail per
+size in ``SIZES`` (WebP, or JPEG where Pillow lacks WebP). ``User.save``
+schedules them on a small thread pool once the upload commits, so requests
+never wait for Pillow; until the variants are written ``avatar_variants``
+is empty and clients get the original. Serializers pick the size they
+render at (``User.get_avatar_url(size)``), so a feed page of author cards
+downloads 96 px thumbnails instead of full-size uploads. Variants are
+content-addressed blobs like the avatar itself (api.blobs).
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from .fragment_cache import fragment_cache
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+SIZES = (48, 96, 256)
+# What each representation renders at (twice its CSS size, for HiDPI)
+COMMENT_SIZE = 48
+CARD_SIZE = 96
+PROFILE_SIZE = 256
+
+FORMAT, EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+QUALITY = 82
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AVATAR_THUMBNAIL_WORKERS', 2),
+                    thread_name_prefix='avatar-thumbnails')
+    return _executor
+
+
+def variant_name(name, size):
+    return f'{os.path.splitext(name)[0]}_{size}.{EXTENSION}'
+
+
+def render(image, size):
+    """``image`` cropped to a ``size`` px square, encoded as ``FORMAT``."""
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    if FORMAT == 'JPEG' or thumbnail.mode not in ('RGB', 'RGBA'):
+        thumbnail = thumbnail.convert('RGB' if FORMAT == 'JPEG' else 'RGBA')
+    out = io.BytesIO()
+    thumbnail.save(out, FORMAT, quality=QUALITY)
+    return out.getvalue()
+
+
+def generate(user_id, name):
+    """
+    Write the variants of ``name`` and record them on the user if it is
+    still their avatar, releasing the variants they replace.
+    """
+    storage = User._meta.get_field('avatar').storage
+    with storage.open(name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+
+    variants = {str(size): storage.save(variant_name(name, size),
+                                        ContentFile(render(image, size)))
+                for size in SIZES}
+
+    with transaction.atomic():
+        user = (User.objects.select_for_update().filter(pk=user_id, avatar=name)
+                .only('avatar_variants').first())
+        if user is None:
+            # Replaced while we worked; the newer upload has its own job
+            released = variants.values()
+        else:
+            released = user.avatar_variants.values()
+            User.objects.filter(pk=user_id).update(avatar_variants=variants)
+        for target in released:
+            storage.delete(target)
+    if user is not None:
+        fragment_cache.bump('user', user_id)
+    return variants
+
+
+def _run(user_id, name):
+    try:
+        generate(user_id, name)
+    except Exception:
+        logger.exception('Generating avatar variants of user %s failed', user_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(user_id, name):
+    """Generate the variants in the background once the upload commits."""
+    transaction.on_commit(lambda: executor().submit(_run, user_id, name))
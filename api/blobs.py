@@ -0,0 +1,197 @@
+"""
+Content-addressed, deduplicated media storage.
+
+Files saved through ``ContentAddressedStorage`` are named after the SHA-256
+of their bytes (``cas/ab/cd/<digest>.<ext>``), so a picture uploaded as
+several avatars or sent to several chats is written to disk once. A ``Blob``
+row counts the references to each file from ``User.avatar``, the avatar
+variants (api.avatars) and ``Message.attachment``: saving a file adds one,
+``delete`` drops one, both inside the caller's transaction, so a rolled
+back upload or delete leaves the count as it was.
+
+Files are only removed by ``manage.py collect_blobs``, which deletes each
+unreferenced blob under a lock on its row: a concurrent upload of the same
+bytes waits for the lock and writes the file again. The command can also
+recount every blob from the referencing columns.
+
+Since a name always denotes the same bytes, blobs can be cached forever.
+In production the web server or CDN serving ``MEDIA_ROOT`` should send a
+one-year ``immutable`` Cache-Control for ``MEDIA_URL/cas/``; with ``DEBUG``
+on, ``serve`` does so itself, with the digest as ETag. Files saved before this storage existed keep their names and are served
+and deleted as before.
+"""
+import datetime
+import hashlib
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import HttpResponseNotModified
+from django.utils import timezone
+from django.views.static import serve as serve_file
+
+PREFIX = 'cas'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Files without a row are left alone this long: they may belong to an
+# upload that has not committed yet
+ORPHAN_GRACE = datetime.timedelta(hours=1)
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{PREFIX}/')
+
+
+def blob_name(name, digest):
+    extension = os.path.splitext(name)[1].lower()
+    return f'{PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """``FileSystemStorage`` storing each distinct content once; see the module docstring."""
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        name = blob_name(name, digest.hexdigest())
+
+        with transaction.atomic():
+            # Taking the reference first waits out a collection in progress
+            add_reference(name, size)
+            if self.exists(name):
+                # Keeps the collector from treating it as an orphan
+                os.utime(self.path(name))
+            else:
+                # Written aside and renamed, so readers never see a partial
+                # file and concurrent writers of the same bytes cannot clash
+                upload = super()._save(f'{name}.upload', content)
+                os.replace(self.path(upload), self.path(name))
+        return name
+
+    def delete(self, name):
+        """Drop one reference to a blob; other files are deleted on commit."""
+        if is_blob(name):
+            release(name)
+        elif name:
+            transaction.on_commit(lambda: super(ContentAddressedStorage, self).delete(name))
+
+    def remove(self, name):
+        """Delete the file itself."""
+        super().delete(name)
+
+
+_storage = None
+
+
+def content_storage():
+    """The storage of every field holding blobs (a callable, so migrations stay portable)."""
+    global _storage
+    if _storage is None:
+        _storage = ContentAddressedStorage()
+    return _storage
+
+
+def _table():
+    from .models import Blob
+    return connection.ops.quote_name(Blob._meta.db_table)
+
+
+def add_reference(name, size):
+    table = _table()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (name, size, refcount, created_at) '
+            f'VALUES (%s, %s, 1, %s) '
+            f'ON CONFLICT (name) DO UPDATE SET refcount = {table}.refcount + 1',
+            [name, size, timezone.now()])
+
+
+def release(name):
+    from .models import Blob
+    Blob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+
+
+def referenced_names():
+    """``Counter`` of blob names over every column that references blobs."""
+    from communications.models import Message
+    from .models import User
+
+    counts = Counter()
+    avatars = (User.objects.exclude(avatar='').exclude(avatar=None)
+               .values_list('avatar', 'avatar_variants').iterator(chunk_size=2000))
+    for avatar, variants in avatars:
+        counts.update(name for name in (avatar, *variants.values()) if is_blob(name))
+    attachments = (Message.objects.filter(attachment__startswith=f'{PREFIX}/')
+                   .values_list('attachment', flat=True).iterator(chunk_size=2000))
+    counts.update(attachments)
+    return counts
+
+
+def recount():
+    """Reset every refcount from the referencing columns; returns how many changed."""
+    from .models import Blob
+
+    counts = referenced_names()
+    changed = []
+    for blob in Blob.objects.only('id', 'name', 'refcount').iterator(chunk_size=2000):
+        if blob.refcount != counts.get(blob.name, 0):
+            blob.refcount = counts.get(blob.name, 0)
+            changed.append(blob)
+    Blob.objects.bulk_update(changed, ['refcount'], batch_size=500)
+    return len(changed)
+
+
+def collect(orphan_grace=ORPHAN_GRACE):
+    """
+    Delete unreferenced blobs and files under ``cas/`` that have no row.
+    Returns ``(blobs, orphans)`` removed.
+    """
+    from .models import Blob
+
+    storage = content_storage()
+    blobs = 0
+    names = Blob.objects.filter(refcount=0).values_list('name', flat=True)
+    for name in list(names):
+        with transaction.atomic():
+            unreferenced = Blob.objects.select_for_update().filter(name=name, refcount=0)
+            if unreferenced.exists():
+                storage.remove(name)
+                unreferenced.delete()
+                blobs += 1
+
+    orphans = 0
+    cutoff = timezone.now() - orphan_grace
+    for directory in _directories(storage, PREFIX):
+        files = [f'{directory}/{file}' for file in storage.listdir(directory)[1]]
+        known = set(Blob.objects.filter(name__in=files).values_list('name', flat=True))
+        for name in files:
+            if name not in known and storage.get_modified_time(name) < cutoff:
+                storage.remove(name)
+                orphans += 1
+    return blobs, orphans
+
+
+def _directories(storage, top):
+    if not storage.exists(top):
+        return
+    yield top
+    for directory in storage.listdir(top)[0]:
+        yield from _directories(storage, f'{top}/{directory}')
+
+
+def serve(request, path):
+    """A blob under ``MEDIA_URL/cas/``, cacheable forever (development only)."""
+    etag = f'"{os.path.splitext(os.path.basename(path))[0]}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = serve_file(request, f'{PREFIX}/{path}',
+                              document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = CACHE_CONTROL
+    response['ETag'] = etag
+    return response
@@ -0,0 +1,103 @@
+"""
+Conditional GET support (ETag / Last-Modified) for post, profile and feed
+responses.
+
+Validators are derived from the fragment-cache versions of every post and
+user a response is built from (see api.fragment_cache), so checking them
+costs one cache round trip and no serialization. The ETag also covers the
+viewer, the full path and the renderer, because the body depends on all
+three, and the viewer's likes and bookmarks still in the write-behind
+buffer (api.write_behind), which change the body before any version does. Lists and feeds are validated by ETag only: a post leaving the page
+(deleted, or its author unfollowed) changes the set of sources the ETag is
+built from but cannot move the newest version forward, so a Last-Modified
+would wrongly answer 304.
+"""
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import write_behind
+from .fragment_cache import fragment_cache
+
+
+def enabled():
+    return getattr(settings, 'CONDITIONAL_GET_ENABLED', False)
+
+
+def post_sources(posts):
+    """Version sources for rows exposing ``post_id``/``id`` and ``author_id``."""
+    sources = []
+    for post in posts:
+        sources.append(('post', getattr(post, 'post_id', None) or post.pk))
+        sources.append(('user', post.author_id))
+    return sources
+
+
+def get_validators(request, sources, collection=False):
+    """
+    ``(etag, last_modified)`` for a response built from ``sources``;
+    ``last_modified`` is None for a ``collection`` and while the viewer
+    has buffered likes or bookmarks on the posts.
+    """
+    if not enabled() or request.method not in ('GET', 'HEAD'):
+        return None
+    versions = fragment_cache.source_versions(set(sources))
+    renderer = getattr(request, 'accepted_renderer', None)
+    viewer = request.user.pk if request.user.is_authenticated else None
+    pending = []
+    if viewer is not None:
+        pending = write_behind.pending_states(
+            viewer, {source_id for kind, source_id in sources if kind == 'post'})
+    fingerprint = repr((
+        viewer,
+        request.get_full_path(),
+        getattr(renderer, 'format', None),
+        [versions.get(source) for source in sources],
+        list(sources),
+        pending,
+    ))
+    etag = '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+    last_modified = None
+    if versions and not collection and not pending:
+        last_modified = max(versions.values()) // 1_000_000
+    return etag, last_modified
+
+
+def _matches(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # GET uses the weak comparison function (RFC 9110 13.1.2)
+        candidates = [tag[2:] if tag.startswith('W/') else tag
+                      for tag in parse_etags(if_none_match)]
+        return '*' in candidates or etag in candidates
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return (if_modified_since is not None and last_modified is not None
+            and last_modified <= if_modified_since)
+
+
+def _set_headers(response, validators):
+    etag, last_modified = validators
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def not_modified(request, validators):
+    """A 304 response if the client's copy is current, else None."""
+    if validators is None or not _matches(request, *validators):
+        return None
+    return _set_headers(Response(status=status.HTTP_304_NOT_MODIFIED),
+                        validators)
+
+
+def add_validators(response, validators):
+    if validators is None or response.status_code != status.HTTP_200_OK:
+        return response
+    return _set_headers(response, validators)
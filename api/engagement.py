@@ -0,0 +1,185 @@
+"""
+Post, like, bookmark and comment writes.
+
+``Post`` stores ``likes_count``, ``bookmarks_count`` and ``comments_count``
+(and ``User`` stores ``posts_count``) so rendering never counts rows. Every
+write that adds or removes one of those rows goes through here and adjusts
+the counter with an ``F()`` update in the same transaction.
+"""
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from . import events, search, sql, timeline, trending
+from .fragment_cache import fragment_cache
+from .models import Bookmark, Comment, Like, Post, User, count_subquery
+
+COUNTER_FIELDS = {
+    Like: 'likes_count',
+    Bookmark: 'bookmarks_count',
+    Comment: 'comments_count',
+}
+
+# Most posts one batch like/bookmark request may touch or ask about
+BATCH_MAX_POSTS = 100
+
+
+def adjust_counter(post_id, field, delta):
+    Post.objects.filter(pk=post_id).update(**{field: F(field) + delta})
+
+
+def set_state(model, user, post, active):
+    """
+    Create or delete ``user``'s ``model`` row (a Like or Bookmark) on
+    ``post`` and return the post's updated counter.
+
+    The row write is a single ``INSERT ... ON CONFLICT DO NOTHING`` or
+    ``DELETE ... RETURNING`` and the counter comes back from the
+    ``UPDATE ... RETURNING`` that adjusts it, so repeated or concurrent
+    requests are harmless and nothing is read back afterwards. When
+    nothing changed, ``post``'s loaded counter is returned.
+    """
+    field = COUNTER_FIELDS[model]
+    with transaction.atomic():
+        if active:
+            changed = sql.insert_ignore(model, user=user, post=post)
+        else:
+            changed = bool(sql.delete_returning(model, user=user, post=post))
+        if not changed:
+            return getattr(post, field)
+        count = sql.increment_returning(Post, post.pk, field, 1 if active else -1)
+        fragment_cache.bump('post', post.pk)
+        if active:
+            trending.bump(model, [post.pk])
+            if model is Like:
+                events.append(user, 'like', f'Liked post {post.pk}')
+    setattr(post, field, count)
+    return count
+
+
+def set_states(model, user, add=(), remove=()):
+    """
+    Create ``user``'s ``model`` rows (Likes or Bookmarks) on the posts in
+    ``add`` and delete them on the posts in ``remove``, in one transaction
+    and a fixed number of queries. Returns ``{post_id: counter}`` for every
+    existing post asked about; unknown IDs are left out.
+    """
+    field = COUNTER_FIELDS[model]
+    with transaction.atomic():
+        rows = Post.objects.filter(pk__in={*add, *remove}).annotate(
+            active=Exists(model.objects.filter(user=user, post=OuterRef('pk'))),
+        ).values_list('pk', 'active')
+        active = dict(rows)
+
+        created = [post_id for post_id in add
+                   if post_id in active and not active[post_id]]
+        deleted = [post_id for post_id in remove if active.get(post_id)]
+        if created:
+            model.objects.bulk_create(
+                [model(user=user, post_id=post_id) for post_id in created],
+                ignore_conflicts=True)
+            trending.bump(model, created)
+            if model is Like:
+                events.append_many([(user.pk, 'like', f'Liked post {post_id}')
+                                    for post_id in created])
+        if deleted:
+            model.objects.filter(user=user, post_id__in=deleted).delete()
+
+        changed = [*created, *deleted]
+        if changed:
+            # Recount rather than add deltas: a concurrent request may have
+            # won some of the conflicting inserts
+            Post.objects.filter(pk__in=changed).update(
+                **{field: count_subquery(model, 'post')})
+            fragment_cache.bump('post', *changed)
+        return dict(Post.objects.filter(pk__in=active).values_list('pk', field))
+
+
+def apply_states(model, states):
+    """
+    Persist final ``model`` (Like or Bookmark) states of many users at once,
+    given as ``{(user_id, post_id): active}``: one bulk insert, one delete
+    and one recount of the touched posts. States whose user or post no
+    longer exists are dropped.
+    """
+    field = COUNTER_FIELDS[model]
+    with transaction.atomic():
+        users = set(User.objects.filter(
+            pk__in={user_id for user_id, _ in states}).values_list('pk', flat=True))
+        posts = set(Post.objects.filter(
+            pk__in={post_id for _, post_id in states}).values_list('pk', flat=True))
+        states = {(user_id, post_id): active
+                  for (user_id, post_id), active in states.items()
+                  if user_id in users and post_id in posts}
+        if not states:
+            return
+
+        # Only rows that did not exist yet count as new engagement
+        added = sql.insert_ignore_many(
+            model, [{'user_id': user_id, 'post_id': post_id}
+                    for (user_id, post_id), active in states.items() if active],
+            returning=('user', 'post'))
+        if added:
+            trending.bump(model, [post_id for _, post_id in added])
+            if model is Like:
+                events.append_many([(user_id, 'like', f'Liked post {post_id}')
+                                    for user_id, post_id in added])
+        removed = Q()
+        for (user_id, post_id), active in states.items():
+            if not active:
+                removed |= Q(user_id=user_id, post_id=post_id)
+        if removed:
+            model.objects.filter(removed).delete()
+
+        touched = {post_id for _, post_id in states}
+        Post.objects.filter(pk__in=touched).update(
+            **{field: count_subquery(model, 'post')})
+        fragment_cache.bump('post', *touched)
+
+
+def create_post(serializer, author):
+    with transaction.atomic():
+        post = serializer.save(
+            author=author, trending_score=trending.event_score(Post))
+        User.objects.filter(pk=author.pk).update(
+            posts_count=F('posts_count') + 1)
+        # The response embeds this instance as the post's author
+        author.refresh_from_db(fields=['posts_count'])
+        fragment_cache.bump('user', author.pk)
+        search.index_post(post)
+        events.append(author, 'post', f'Created post "{post.title}"')
+    timeline.fan_out_post(post)
+    return post
+
+
+def update_post(serializer):
+    post = serializer.save()
+    search.index_post(post)
+    return post
+
+
+def delete_post(post):
+    post_id = post.pk
+    with transaction.atomic():
+        post.delete()
+        User.objects.filter(pk=post.author_id).update(
+            posts_count=F('posts_count') - 1)
+        fragment_cache.bump('user', post.author_id)
+        search.unindex_post(post_id)
+
+
+def create_comment(serializer, author):
+    with transaction.atomic():
+        comment = serializer.save(author=author)
+        Post.objects.filter(pk=comment.post_id).update(
+            comments_count=F('comments_count') + 1,
+            trending_score=trending.bumped(Comment))
+        fragment_cache.bump('post', comment.post_id)
+        events.append(author, 'comment', f'Commented on post {comment.post_id}')
+    return comment
+
+
+def delete_comment(comment):
+    with transaction.atomic():
+        comment.delete()
+        adjust_counter(comment.post_id, 'comments_count', -1)
+        fragment_cache.bump('post', comment.post_id)
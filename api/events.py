@@ -0,0 +1,153 @@
+"""
+The ``UserActivity`` event log.
+
+Events are only ever appended (``append`` for one, ``append_many`` for a
+batch in one INSERT) and read back newest first, per user or globally, with
+keyset pages over the ``(user, -created_at, -id)`` and ``(-created_at,
+-id)`` indexes.
+
+Every row carries ``partition_key``, the first day of its month. On
+PostgreSQL the table is ``PARTITION BY RANGE (partition_key)`` with one
+partition per month plus a default partition, so a month of events is
+removed with a single ``DROP TABLE`` and reads bounded by time only touch
+the partitions they need. Other backends keep one table and delete old
+months with a range ``DELETE`` on the ``partition_key`` index.
+``manage.py activity_partitions`` creates upcoming partitions and drops
+expired ones.
+"""
+import datetime
+import re
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import UserActivity, month_of
+
+TABLE = UserActivity._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def append(user, activity_type, content=''):
+    return UserActivity.objects.create(
+        user=user, activity_type=activity_type, content=content)
+
+
+def append_many(events):
+    """
+    Append ``(user_id, activity_type, content)`` events in one INSERT (per
+    500 rows), all stamped with the same time.
+    """
+    now = timezone.now()
+    rows = [UserActivity(user_id=user_id, activity_type=activity_type,
+                         content=content, created_at=now,
+                         partition_key=month_of(now))
+            for user_id, activity_type, content in events]
+    return UserActivity.objects.bulk_create(rows, batch_size=500)
+
+
+def tail(user=None, types=None, since=None):
+    """
+    Newest events first, for one user or everyone; page with keysets.
+    ``since`` also bounds ``partition_key`` so older partitions are pruned.
+    """
+    events = UserActivity.objects.all()
+    if user is not None:
+        events = events.filter(user=user)
+    if types:
+        events = events.filter(activity_type__in=types)
+    if since is not None:
+        events = events.filter(created_at__gte=since,
+                               partition_key__gte=month_of(since))
+    return events.order_by('-created_at', '-id')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def uses_partitions():
+    return connection.vendor == 'postgresql'
+
+
+def partition_name(month):
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def partitions(cursor):
+    """``{month: name}`` of the monthly partitions that exist now."""
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = %s::regclass', [TABLE])
+    found = {}
+    for name, in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            found[datetime.date(int(match[1]), int(match[2]), 1)] = name
+    return found
+
+
+def create_partition(cursor, month):
+    """
+    Create ``month``'s partition. Rows already routed to the default
+    partition for that month are moved into it, since PostgreSQL refuses
+    to attach a range the default partition has rows for.
+    """
+    name = connection.ops.quote_name(partition_name(month))
+    bounds = [month, next_month(month)]
+    in_month = 'partition_key >= %s AND partition_key < %s'
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE activity_moved AS '
+        f'SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}', bounds)
+    cursor.execute(f'DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}', bounds)
+    cursor.execute(
+        f'CREATE TABLE {name} PARTITION OF {TABLE} '
+        f'FOR VALUES FROM (%s) TO (%s)', bounds)
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM activity_moved')
+    cursor.execute('DROP TABLE activity_moved')
+
+
+def ensure_partitions(first, last):
+    """Create the missing monthly partitions from ``first`` to ``last``."""
+    if not uses_partitions():
+        return []
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = partitions(cursor)
+        month = month_start(first)
+        while month <= last:
+            if month not in existing:
+                create_partition(cursor, month)
+                created.append(month)
+            month = next_month(month)
+    return created
+
+
+def drop_before(month):
+    """
+    Remove every event older than ``month``. On PostgreSQL each expired
+    partition goes with one ``DROP TABLE``. Returns the months dropped and
+    the number of rows deleted (from the default partition, or from the
+    whole table on other backends).
+    """
+    month = month_start(month)
+    if not uses_partitions():
+        deleted, _ = UserActivity.objects.filter(
+            partition_key__lt=month).delete()
+        return [], deleted
+    dropped = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for old, name in sorted(partitions(cursor).items()):
+            if old < month:
+                cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+                dropped.append(old)
+        # Stragglers that were never routed to a monthly partition
+        cursor.execute(
+            f'DELETE FROM {DEFAULT_PARTITION} WHERE partition_key < %s', [month])
+        deleted = cursor.rowcount
+    return dropped, deleted
@@ -0,0 +1,181 @@
+"""
+In-process cache of the follow graph.
+
+Each user's following and follower IDs are held as a sorted ``array('q')``
+(8 bytes per edge) in an LRU bounded by ``FOLLOW_GRAPH_CACHE['MAX_BYTES']``.
+"Who does A follow", "does A follow B" (a bisection) and "who are A's
+mutual follows" are then answered without querying ``Follow``; viewer
+state, the home feed (api.timeline) and follow/unfollow (api.follows)
+read it.
+
+Entries are validated against a per-user ``follows`` version kept in the
+shared cache next to the fragment versions (api.fragment_cache), which
+api.follows bumps on every follow and unfollow, so a change made through
+any worker invalidates every worker's copy; the version check is one cache
+round trip however many IDs are asked about. The version is read before
+the rows, so an entry can be stale only until the writer's commit bumps it.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from .fragment_cache import fragment_cache
+from .models import Follow, User
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_BYTES': 32 * 1024 * 1024,
+}
+
+MUTUALS_ORDERING = ('id',)
+
+Member = namedtuple('Member', 'id')
+
+# direction -> (owner column, ID column)
+DIRECTIONS = {
+    'following': ('follower_id', 'following_id'),
+    'followers': ('following_id', 'follower_id'),
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'FOLLOW_GRAPH_CACHE', {})}
+
+
+def enabled():
+    return config()['ENABLED']
+
+
+class AdjacencyLRU:
+    """
+    Thread-safe LRU of ``key -> (version, array)`` holding at most
+    ``max_bytes`` of arrays; an array larger than that is never kept.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key, version, ids):
+        size = sys.getsizeof(ids)
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (version, ids)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= sys.getsizeof(entry[1])
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FollowGraph:
+    def __init__(self):
+        self._lru = None
+
+    @property
+    def enabled(self):
+        return enabled()
+
+    @property
+    def lru(self):
+        if self._lru is None:
+            self._lru = AdjacencyLRU(config()['MAX_BYTES'])
+        return self._lru
+
+    def ids(self, direction, user_id):
+        """Sorted IDs ``user_id`` follows (or is followed by)."""
+        owner, column = DIRECTIONS[direction]
+        if not self.enabled:
+            return self._load(owner, column, user_id)
+        version = fragment_cache.versions('follows', [user_id])[user_id]
+        entry = self.lru.get((direction, user_id))
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        ids = self._load(owner, column, user_id)
+        self.lru.set((direction, user_id), version, ids)
+        return ids
+
+    @staticmethod
+    def _load(owner, column, user_id):
+        rows = (Follow.objects.filter(**{owner: user_id})
+                .order_by(column).values_list(column, flat=True))
+        return array('q', rows)
+
+    def following_ids(self, user_id):
+        return self.ids('following', user_id)
+
+    def follower_ids(self, user_id):
+        return self.ids('followers', user_id)
+
+    def is_following(self, user_id, other_id):
+        return other_id in self.followed_among(user_id, [other_id])
+
+    def followed_among(self, user_id, other_ids):
+        """The subset of ``other_ids`` that ``user_id`` follows."""
+        ids = self.following_ids(user_id)
+        found = set()
+        for other_id in other_ids:
+            position = bisect_left(ids, other_id)
+            if position < len(ids) and ids[position] == other_id:
+                found.add(other_id)
+        return found
+
+    def mutuals(self, user_id):
+        """Sorted IDs that ``user_id`` follows and is followed by."""
+        followers = self.follower_ids(user_id)
+        return sorted(set(self.following_ids(user_id)).intersection(followers))
+
+    def invalidate(self, *user_ids):
+        """Forget these users' edges here now and in every worker on commit."""
+        fragment_cache.bump('follows', *user_ids)
+        self.lru.discard([(direction, user_id)
+                          for direction in DIRECTIONS for user_id in user_ids])
+
+    def stats(self):
+        return {'enabled': self.enabled, 'entries': len(self.lru),
+                'bytes': self.lru.size, 'max_bytes': self.lru.max_bytes}
+
+
+follow_graph = FollowGraph()
+
+
+def mutuals_page(user_id, paginator, request):
+    """
+    One page of ``user_id``'s mutual follows as users, by ascending ID.
+    ``paginator`` must be ordered by ``MUTUALS_ORDERING``.
+    """
+    members = [Member(pk) for pk in follow_graph.mutuals(user_id)]
+    page = paginator.paginate_sorted(members, request)
+    users = User.objects.in_bulk([member.id for member in page])
+    return [users[member.id] for member in page if member.id in users]
@@ -0,0 +1,59 @@
+"""
+Follow and unfollow writes.
+
+Both sides of a follow carry a denormalized counter (``followers_count`` and
+``following_count`` on ``User``); they are adjusted in the same transaction
+as the ``Follow`` row, and the follower's home timeline and the affected
+follow suggestions are updated after.
+The row write is a single idempotent statement (see api.sql) and the new
+counters come back from the updates, which also refresh both instances.
+With the follow graph cache on (api.follow_graph), a request that would
+change nothing is answered from it without touching the database.
+"""
+from django.db import transaction
+
+from . import events, sql, suggestions, timeline
+from .follow_graph import follow_graph
+from .fragment_cache import fragment_cache
+from .models import Follow, User
+
+
+def _adjust_counters(follower, following, delta):
+    follower.following_count = sql.increment_returning(
+        User, follower.pk, 'following_count', delta)
+    following.followers_count = sql.increment_returning(
+        User, following.pk, 'followers_count', delta)
+    fragment_cache.bump('user', follower.pk, following.pk)
+
+
+def follow(follower, following):
+    """Follow ``following``; returns False if already following."""
+    if follow_graph.enabled and follow_graph.is_following(follower.pk, following.pk):
+        return False
+    with transaction.atomic():
+        created = sql.insert_ignore(
+            Follow, follower=follower, following=following)
+        if created:
+            _adjust_counters(follower, following, 1)
+            follow_graph.invalidate(follower.pk, following.pk)
+            events.append(follower, 'follow', f'Followed {following.username}')
+    if created:
+        timeline.add_author(follower, following)
+        suggestions.followed(follower, following)
+    return created
+
+
+def unfollow(follower, following):
+    """Unfollow ``following``; returns False if not following."""
+    if follow_graph.enabled and not follow_graph.is_following(follower.pk, following.pk):
+        return False
+    with transaction.atomic():
+        deleted = bool(sql.delete_returning(
+            Follow, follower=follower, following=following))
+        if deleted:
+            _adjust_counters(follower, following, -1)
+            follow_graph.invalidate(follower.pk, following.pk)
+    if deleted:
+        timeline.remove_author(follower, following)
+        suggestions.unfollowed(follower, following)
+    return deleted
@@ -0,0 +1,176 @@
+"""
+Versioned fragment cache for serialized posts and user cards.
+
+The viewer-independent part of a representation is cached under a key that
+embeds the version of every row it was built from, so bumping a version
+(on edit, like, comment, follow or profile change) makes stale fragments
+unreachable instead of having to find and delete them. Versions live in the
+shared Django cache so every worker agrees on them; fragments are read
+through a small in-process LRU first.
+
+Versions are microsecond timestamps, so they double as modification times.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DEFAULTS = {
+    'ENABLED': False,
+    'CACHE_ALIAS': 'default',
+    'LOCAL_MAX_ENTRIES': 2048,
+    'TIMEOUT': 60 * 60,
+}
+
+
+def now_version():
+    return time.time_ns() // 1000
+
+
+class LocalLRU:
+    """Thread-safe in-process LRU mapping with a fixed number of entries."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, mapping):
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FragmentCache:
+    def __init__(self):
+        self._local = None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def config(self):
+        return {**DEFAULTS, **getattr(settings, 'FRAGMENT_CACHE', {})}
+
+    @property
+    def enabled(self):
+        return self.config['ENABLED']
+
+    @property
+    def shared(self):
+        return caches[self.config['CACHE_ALIAS']]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalLRU(self.config['LOCAL_MAX_ENTRIES'])
+        return self._local
+
+    # Versions
+
+    @staticmethod
+    def version_key(kind, pk):
+        return f'frag:ver:{kind}:{pk}'
+
+    def versions(self, kind, pks):
+        """Current version of each ``kind`` row, creating missing ones."""
+        found = self.source_versions([(kind, pk) for pk in pks])
+        return {pk: version for (_, pk), version in found.items()}
+
+    def source_versions(self, sources):
+        """Current version of each ``(kind, pk)`` pair, in one round trip."""
+        keys = {self.version_key(kind, pk): (kind, pk) for kind, pk in sources}
+        found = self.shared.get_many(list(keys))
+        missing = [key for key in keys if key not in found]
+        if missing:
+            # A version that was evicted restarts at "now", which is newer
+            # than anything cached or validated under the old one.
+            version = now_version()
+            for key in missing:
+                self.shared.add(key, version, timeout=None)
+            found.update(self.shared.get_many(missing))
+        return {keys[key]: value for key, value in found.items()}
+
+    def bump(self, kind, *pks):
+        """
+        Invalidate fragments built from these rows once the write commits.
+
+        Versions are kept even with fragment caching disabled because
+        conditional GETs (api.conditional) validate against them too.
+        """
+        def apply():
+            version = now_version()
+            self.shared.set_many(
+                {self.version_key(kind, pk): version for pk in pks},
+                timeout=None)
+
+        transaction.on_commit(apply)
+
+    # Fragments
+
+    @staticmethod
+    def fragment_key(kind, pk, versions, shape):
+        digest = hashlib.md5(shape.encode()).hexdigest()[:8]
+        return f"frag:{kind}:{pk}:{'.'.join(map(str, versions))}:{digest}"
+
+    def get_many(self, keys):
+        found = self.local.get_many(keys)
+        local_hits = len(found)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            shared = self.shared.get_many(missing)
+            if shared:
+                self.local.set_many(shared)
+                found.update(shared)
+        self._record(local_hits, len(found) - local_hits,
+                     len(keys) - len(found))
+        return found
+
+    def set_many(self, mapping):
+        self.local.set_many(mapping)
+        self.shared.set_many(mapping, timeout=self.config['TIMEOUT'])
+
+    # Stats
+
+    def _record(self, local_hits, shared_hits, misses):
+        with self._stats_lock:
+            self._stats['local_hits'] += local_hits
+            self._stats['shared_hits'] += shared_hits
+            self._stats['misses'] += misses
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['lookups'] = lookups
+        stats['hit_ratio'] = (
+            round((stats['local_hits'] + stats['shared_hits']) / lookups, 4)
+            if lookups else None)
+        stats['enabled'] = self.enabled
+        return stats
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,44 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api import events
+from api.models import month_of
+
+
+class Command(BaseCommand):
+    help = ('Create the upcoming monthly partitions of the activity log and '
+            'drop the ones older than the retention window')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=3,
+            help='Months after the current one to create partitions for')
+        parser.add_argument(
+            '--keep', type=int, default=None,
+            help='Months to keep, including the current one; older months '
+                 'are dropped (default: keep everything)')
+
+    def handle(self, *args, **options):
+        if options['ahead'] < 0:
+            raise CommandError('--ahead must not be negative')
+        if options['keep'] is not None and options['keep'] < 1:
+            raise CommandError('--keep must be at least 1')
+
+        current = month_of(timezone.now())
+        last = current
+        for _ in range(options['ahead']):
+            last = events.next_month(last)
+        created = events.ensure_partitions(current, last)
+        self.stdout.write(f'Created {len(created)} partitions')
+
+        if options['keep'] is not None:
+            cutoff = current
+            for _ in range(options['keep'] - 1):
+                cutoff = (cutoff - datetime.timedelta(days=1)).replace(day=1)
+            dropped, deleted = events.drop_before(cutoff)
+            self.stdout.write(
+                f'Dropped {len(dropped)} partitions and deleted {deleted} '
+                f'events before {cutoff:%Y-%m}')
+        self.stdout.write(self.style.SUCCESS('Activity partitions are up to date'))
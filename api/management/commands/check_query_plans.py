@@ -0,0 +1,64 @@
+from importlib import import_module
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.module_loading import module_has_submodule
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN every hot query listed in the apps\' query_plans modules '
+            'and check that each one uses its intended index')
+
+    def handle(self, *args, **options):
+        failures = 0
+        for plan in self.plans():
+            names = self.index_names(plan.model, plan.columns)
+            explained = self.explain(plan.queryset())
+            if names and any(name in explained for name in names):
+                self.stdout.write(f'OK    {plan.name}')
+                continue
+            failures += 1
+            expected = ', '.join(names) or f'(no index on {plan.columns})'
+            self.stdout.write(self.style.ERROR(
+                f'FAIL  {plan.name}: expected {expected}'))
+            self.stdout.write(explained)
+
+        if failures:
+            raise CommandError(f'{failures} queries do not use their index')
+        self.stdout.write(self.style.SUCCESS('All query plans use their index'))
+
+    @staticmethod
+    def plans():
+        for app_config in apps.get_app_configs():
+            if module_has_submodule(app_config.module, 'query_plans'):
+                yield from import_module(f'{app_config.name}.query_plans').PLANS
+
+    @staticmethod
+    def index_names(model, columns):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table)
+            # Any index whose leading columns are ``columns`` will do
+            names = [name for name, info in constraints.items()
+                     if (info['index'] or info['unique'])
+                     and info['columns'][:len(columns)] == columns]
+            if names and connection.vendor == 'postgresql':
+                # Plans over a partitioned table name each partition's index
+                cursor.execute(
+                    'SELECT child.relname FROM pg_inherits '
+                    'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                    'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+                    'WHERE parent.relname = ANY(%s)', [names])
+                names += [name for name, in cursor.fetchall()]
+        return names
+
+    @staticmethod
+    def explain(queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small development tables are cheaper to scan; ask which
+                # index the planner would pick once scanning is not an option.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import blobs
+
+
+class Command(BaseCommand):
+    help = ('Delete content-addressed media files that no avatar or chat '
+            'attachment references any more')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='First reset every reference count from the referencing columns')
+        parser.add_argument(
+            '--orphan-hours', type=int, default=1,
+            help='Keep files without a row for this many hours (uploads in flight)')
+
+    def handle(self, *args, **options):
+        if options['orphan_hours'] < 0:
+            raise CommandError('--orphan-hours must not be negative')
+        if options['recount']:
+            changed = blobs.recount()
+            self.stdout.write(f'Corrected {changed} reference counts')
+        removed, orphans = blobs.collect(
+            datetime.timedelta(hours=options['orphan_hours']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {removed} unreferenced blobs and {orphans} orphaned files'))
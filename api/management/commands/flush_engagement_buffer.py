@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import write_behind
+
+
+class Command(BaseCommand):
+    help = 'Persist like/bookmark states waiting in the write-behind buffer'
+
+    def handle(self, *args, **options):
+        flushed = write_behind.flush()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} states'))
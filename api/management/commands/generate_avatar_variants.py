@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api import avatars
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Write the thumbnail variants of uploaded avatars'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Only these users (default: everyone with an avatar)')
+        parser.add_argument('--missing', action='store_true',
+                            help='Skip avatars that already have variants')
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(avatar='').exclude(avatar=None).order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        if options['missing']:
+            users = users.filter(avatar_variants={})
+
+        generated = failed = 0
+        for user in users.only('id', 'avatar').iterator(chunk_size=500):
+            try:
+                avatars.generate(user.pk, user.avatar.name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{user.pk}: {error}')
+            else:
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated variants for {generated} avatars ({failed} failed)'))
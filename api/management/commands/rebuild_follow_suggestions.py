@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api import suggestions
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Recompute who-to-follow suggestions from the follow graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Only rebuild these users (default: everyone)')
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['usernames']:
+            user_ids = User.objects.filter(
+                username__in=options['usernames']).values_list('pk', flat=True)
+        processed = suggestions.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt suggestions for {processed} users'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api import timeline
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or just trim) materialized home timelines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Only rebuild these users (default: everyone)')
+        parser.add_argument('--trim-only', action='store_true',
+                            help='Only enforce TIMELINE_MAX_ENTRIES')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        processed = trimmed = 0
+        for user in users.iterator(chunk_size=500):
+            if options['trim_only']:
+                trimmed += timeline.trim(user.id)
+            else:
+                timeline.rebuild(user)
+            processed += 1
+
+        if options['trim_only']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Trimmed {trimmed} entries across {processed} timelines'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {processed} timelines'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from api.models import Bookmark, Comment, Like, Post, count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized like/bookmark/comment counters on posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Post.objects.aggregate(last=Max('id'))['last'] or 0
+
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            # One UPDATE per id range keeps each statement's locks short
+            updated += Post.objects.filter(
+                id__gte=start, id__lt=start + batch_size,
+            ).update(
+                likes_count=count_subquery(Like, 'post'),
+                bookmarks_count=count_subquery(Bookmark, 'post'),
+                comments_count=count_subquery(Comment, 'post'),
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted engagement for {updated} posts'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from api.models import Follow, Post, User, count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized follower/following/post counters on users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+
+        updated = 0
+        for start in range(0, last_id + 1, batch_size):
+            # One UPDATE per id range keeps each statement's locks short
+            updated += User.objects.filter(
+                id__gte=start, id__lt=start + batch_size,
+            ).update(
+                followers_count=count_subquery(Follow, 'following'),
+                following_count=count_subquery(Follow, 'follower'),
+                posts_count=count_subquery(Post, 'author'),
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recounted counters for {updated} users'))
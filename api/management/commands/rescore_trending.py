@@ -0,0 +1,43 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api import trending
+from api.models import Bookmark, Comment, Like, Post
+
+
+class Command(BaseCommand):
+    help = ('Recompute the trending scores of posts published or engaged '
+            'with recently from their likes, bookmarks and comments')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=72,
+            help='Rescore posts with activity in this many past hours')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rescore every post (after first deploying trending scores)')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Posts rescored per pass')
+
+    def handle(self, *args, **options):
+        if options['hours'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--hours and --batch-size must be positive')
+        if options['all']:
+            post_ids = set(Post.objects.values_list('pk', flat=True))
+        else:
+            since = timezone.now() - datetime.timedelta(hours=options['hours'])
+            post_ids = set(Post.objects.filter(
+                created_at__gte=since).values_list('pk', flat=True))
+            for model in (Like, Bookmark, Comment):
+                post_ids.update(model.objects.filter(
+                    created_at__gte=since).values_list('post_id', flat=True))
+
+        post_ids = sorted(post_ids)
+        size = options['batch_size']
+        rescored = 0
+        for start in range(0, len(post_ids), size):
+            rescored += len(trending.rescore(post_ids[start:start + size]))
+        self.stdout.write(self.style.SUCCESS(f'Rescored {rescored} posts'))
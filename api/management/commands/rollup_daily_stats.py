@@ -0,0 +1,73 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api import analytics
+from api.models import DailyRollup
+
+
+class Command(BaseCommand):
+    help = ('Store per-day counts and end-of-day totals of signups, posts, '
+            'comments, likes and bookmarks for finished days that are not '
+            'rolled up yet')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', metavar='YYYY-MM-DD',
+            help='Recount every day from this date, even if already rolled up')
+        parser.add_argument(
+            '--days-per-batch', type=int, default=31,
+            help='Days counted per grouped query')
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        if options['since']:
+            first = parse_date(options['since'])
+            if first is None:
+                raise CommandError('--since must be a date as YYYY-MM-DD')
+        else:
+            first = self.first_pending_day()
+        if first is None or first > yesterday:
+            self.stdout.write('Nothing to roll up')
+            return
+
+        rolled = 0
+        step = datetime.timedelta(days=options['days_per_batch'] - 1)
+        while first <= yesterday:
+            last = min(first + step, yesterday)
+            counts = analytics.live_daily_counts(first, last)
+            # Totals at the end of the batch, walked back one day at a time
+            totals = analytics.live_totals(
+                until=last + datetime.timedelta(days=1))
+            rows = []
+            days = analytics.days_between(first, last)
+            for position in reversed(range(len(days))):
+                rows.append(DailyRollup(
+                    date=days[position],
+                    **{metric: series[position] for metric, series in counts.items()},
+                    **{f'{metric}_total': totals[metric] for metric in totals}))
+                for metric, series in counts.items():
+                    totals[metric] -= series[position]
+            DailyRollup.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['date'],
+                update_fields=[*analytics.METRICS,
+                               *(f'{metric}_total' for metric in analytics.METRICS),
+                               'updated_at'])
+            rolled += len(rows)
+            first = last + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rolled} days'))
+
+    @staticmethod
+    def first_pending_day():
+        until = analytics.rolled_up_until()
+        if until is not None:
+            return until + datetime.timedelta(days=1)
+        # First run: start at the oldest row of any metric
+        oldest = [model.objects.aggregate(first=Min(field))['first']
+                  for model, field in analytics.METRICS.values()]
+        oldest = [timezone.localtime(value).date() for value in oldest if value]
+        return min(oldest) if oldest else None
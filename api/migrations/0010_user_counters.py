@@ -0,0 +1,47 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:03
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+
+    def count(model_name, field):
+        rows = (apps.get_model('api', model_name).objects
+                .filter(**{field: OuterRef('pk')}).order_by().values(field)
+                .annotate(total=Count('*')).values('total'))
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    User.objects.update(
+        followers_count=count('Follow', 'following'),
+        following_count=count('Follow', 'follower'),
+        posts_count=count('Post', 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_post_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Only PostgreSQL has tsvector; other backends search with the in-process
+# index in api.search and leave the column empty.
+CREATE_SEARCH = """
+CREATE FUNCTION api_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER api_post_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content, search_vector ON api_post
+    FOR EACH ROW EXECUTE FUNCTION api_post_search_vector_update();
+
+UPDATE api_post SET title = title;
+
+CREATE INDEX api_post_search_vector_gin ON api_post USING gin (search_vector);
+"""
+
+DROP_SEARCH = """
+DROP INDEX IF EXISTS api_post_search_vector_gin;
+DROP TRIGGER IF EXISTS api_post_search_vector_trigger ON api_post;
+DROP FUNCTION IF EXISTS api_post_search_vector_update();
+"""
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
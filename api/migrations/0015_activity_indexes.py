@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:20
+
+from django.db import migrations, models
+
+from api.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0014_created_at_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='bookmark',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='bookmark_user_recent_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='comment_author_recent_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='like',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='like_user_recent_idx'),
+        ),
+    ]
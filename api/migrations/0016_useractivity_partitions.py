@@ -0,0 +1,143 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:24
+
+import datetime
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+# Only PostgreSQL partitions the event log; other backends keep the plain
+# table and its partition_key index (see api.events).
+PARTITION_TABLE = """
+ALTER TABLE api_useractivity RENAME TO api_useractivity_unpartitioned;
+
+CREATE TABLE api_useractivity (
+    id bigint NOT NULL,
+    activity_type varchar(50) NOT NULL,
+    content text NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    user_id bigint NOT NULL,
+    partition_key date NOT NULL
+) PARTITION BY RANGE (partition_key);
+
+CREATE TABLE api_useractivity_default PARTITION OF api_useractivity DEFAULT;
+"""
+
+COPY_ROWS = """
+INSERT INTO api_useractivity (id, activity_type, content, created_at, user_id, partition_key)
+SELECT id, activity_type, content, created_at, user_id, partition_key
+FROM api_useractivity_unpartitioned;
+
+DROP TABLE api_useractivity_unpartitioned;
+
+CREATE SEQUENCE api_useractivity_id_seq OWNED BY api_useractivity.id;
+SELECT setval('api_useractivity_id_seq', coalesce(max(id), 0) + 1, false) FROM api_useractivity;
+ALTER TABLE api_useractivity ALTER COLUMN id SET DEFAULT nextval('api_useractivity_id_seq');
+
+-- Unique constraints on a partitioned table must include the partition key
+ALTER TABLE api_useractivity ADD PRIMARY KEY (id, partition_key);
+ALTER TABLE api_useractivity ADD CONSTRAINT api_useractivity_user_id_fk_api_user_id
+    FOREIGN KEY (user_id) REFERENCES api_user (id) DEFERRABLE INITIALLY DEFERRED;
+
+CREATE INDEX event_user_recent_idx ON api_useractivity (user_id, created_at DESC, id DESC);
+CREATE INDEX event_recent_idx ON api_useractivity (created_at DESC, id DESC);
+CREATE INDEX event_partition_idx ON api_useractivity (partition_key);
+"""
+
+UNPARTITION_TABLE = """
+CREATE TABLE api_useractivity_unpartitioned (LIKE api_useractivity INCLUDING DEFAULTS);
+INSERT INTO api_useractivity_unpartitioned SELECT * FROM api_useractivity;
+ALTER SEQUENCE api_useractivity_id_seq OWNED BY api_useractivity_unpartitioned.id;
+DROP TABLE api_useractivity;
+ALTER TABLE api_useractivity_unpartitioned RENAME TO api_useractivity;
+
+ALTER TABLE api_useractivity ADD PRIMARY KEY (id);
+ALTER TABLE api_useractivity ADD CONSTRAINT api_useractivity_user_id_fk_api_user_id
+    FOREIGN KEY (user_id) REFERENCES api_user (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX api_useractivity_user_id ON api_useractivity (user_id);
+CREATE INDEX event_user_recent_idx ON api_useractivity (user_id, created_at DESC, id DESC);
+CREATE INDEX event_recent_idx ON api_useractivity (created_at DESC, id DESC);
+CREATE INDEX event_partition_idx ON api_useractivity (partition_key);
+"""
+
+# Monthly partitions created ahead of time; the default partition catches
+# anything later (manage.py activity_partitions keeps this window open)
+MONTHS_AHEAD = 3
+
+
+def fill_partition_key(apps, schema_editor):
+    UserActivity = apps.get_model('api', 'UserActivity')
+    UserActivity.objects.update(partition_key=TruncMonth(
+        'created_at', output_field=models.DateField(),
+        tzinfo=datetime.timezone.utc))
+
+
+# Partition helpers as of this migration, so later changes to api.events
+# cannot change what it does
+def next_month(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def create_partitions(schema_editor, first, last):
+    """Monthly partitions from ``first`` to ``last``, on the new empty table."""
+    month = first.replace(day=1)
+    while month <= last:
+        schema_editor.execute(
+            f'CREATE TABLE api_useractivity_y{month.year}m{month.month:02d} '
+            f'PARTITION OF api_useractivity FOR VALUES FROM (%s) TO (%s)',
+            [month, next_month(month)])
+        month = next_month(month)
+
+
+def partition_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min(partition_key) FROM api_useractivity')
+        oldest, = cursor.fetchone()
+    month = django.utils.timezone.now().astimezone(datetime.timezone.utc).date().replace(day=1)
+    for _ in range(MONTHS_AHEAD):
+        month = next_month(month)
+    schema_editor.execute(PARTITION_TABLE)
+    create_partitions(schema_editor, oldest or month, month)
+    schema_editor.execute(COPY_ROWS)
+
+
+def unpartition_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(UNPARTITION_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_activity_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useractivity',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='useractivity',
+            name='partition_key',
+            field=models.DateField(default=datetime.date(1970, 1, 1), editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_partition_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='event_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['-created_at', '-id'], name='event_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['partition_key'], name='event_partition_idx'),
+        ),
+        migrations.RunPython(partition_table, unpartition_table),
+    ]
@@ -1,28 +1,93 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+import datetime
+
+from django.db import models, transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
 
+from .blobs import content_storage
+from .fragment_cache import fragment_cache
+
+
+def count_subquery(model, field, outer='pk'):
+    """Correlated ``COUNT(*)`` of ``model`` rows whose ``field`` matches ``outer``."""
+    counts = (model.objects.filter(**{field: OuterRef(outer)})
+              .order_by().values(field)
+              .annotate(total=Count('*')).values('total'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class PostQuerySet(models.QuerySet):
+    def with_author(self):
+        """
+        Join the author so serializing a page costs one query; engagement
+        and author counts are stored on the rows themselves and viewer
+        state is batch-loaded by api.loaders.ViewerState.
+        """
+        return self.select_related('author')
+
+
+class CommentQuerySet(models.QuerySet):
+    def with_author(self):
+        return self.select_related('author')
+
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     bio = models.TextField(max_length=500, blank=True, default='')
-    avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
+    avatar = models.ImageField(upload_to='avatars/', storage=content_storage,
+                               null=True, blank=True)
+    # {size: blob name} of the thumbnails written by api.avatars
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     website = models.URLField(max_length=200, blank=True, default='')
+    # Maintained by api.follows / api.engagement; repaired by
+    # `manage.py recount_user_counters`
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined'], name='user_joined_idx'),
+        ]
+
+    objects = UserManager()
 
     def __str__(self):
         return self.username
 
-    @property
-    def followers_count(self):
-        return self.followers.count()
-
-    @property
-    def following_count(self):
-        return self.following.count()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # The stored avatar, whose blob is released when it is replaced
+        user._stored_avatar = user.__dict__.get('avatar')
+        return user
 
-    @property
-    def posts_count(self):
-        return self.post_set.count()
+    def save(self, *args, **kwargs):
+        # A newly assigned upload is not committed to storage until saved
+        uploaded = bool(self.avatar) and not self.avatar._committed
+        stored = getattr(self, '_stored_avatar', None)
+        released = []
+        if uploaded or not self.avatar:
+            released = list(self.avatar_variants.values())
+            self.avatar_variants = {}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # An upload of the same bytes gets the same name and its own
+            # reference, so the stored one is released all the same
+            if stored and (uploaded or stored != self.avatar.name):
+                released.append(stored)
+            for name in released:
+                self.avatar.storage.delete(name)
+        self._stored_avatar = self.avatar.name or None
+        fragment_cache.bump('user', self.pk)
+        if uploaded:
+            from .avatars import schedule
+            schedule(self.pk, self.avatar.name)
 
     @property
     def activity_summary(self):
@@ -35,10 +100,19 @@ class User(AbstractUser):
             'bookmarks_count': self.bookmark_set.count(),
         }
 
-    def get_avatar_url(self):
-        if self.avatar:
-            return self.avatar.url
-        return None  # Return None for default avatar handling in frontend
+    def get_avatar_url(self, size=None):
+        """
+        URL of the smallest avatar variant at least ``size`` px wide, or of
+        the original when there is none (yet).
+        """
+        if not self.avatar:
+            return None  # Return None for default avatar handling in frontend
+        if size is not None:
+            for width, name in sorted((int(width), name) for width, name
+                                      in self.avatar_variants.items()):
+                if width >= size:
+                    return self.avatar.storage.url(name)
+        return self.avatar.url
 
 
 class Post(models.Model):
@@ -47,6 +121,27 @@ class Post(models.Model):
     author = models.ForeignKey('User', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by api.engagement; repaired by `manage.py recount_engagement`
+    likes_count = models.PositiveIntegerField(default=0)
+    bookmarks_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    # Filled by a database trigger on PostgreSQL (see api.search)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Log-space decayed engagement, maintained by api.trending; repaired by
+    # `manage.py rescore_trending`
+    trending_score = models.FloatField(default=0.0, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'],
+                         name='post_recent_idx'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='post_author_recent_idx'),
+            models.Index(fields=['-trending_score', '-id'],
+                         name='post_trending_idx'),
+        ]
     # Remove these fields as we'll use the relationship models instead
     # likes = models.ManyToManyField('User', related_name='liked_posts', blank=True)
     # bookmarks = models.ManyToManyField('User', related_name='bookmarked_posts', blank=True)
@@ -54,6 +149,10 @@ class Post(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        fragment_cache.bump('post', self.pk)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -63,16 +162,53 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at', 'id'],
+                         name='comment_post_created_idx'),
+            models.Index(fields=['created_at'], name='comment_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='comment_author_recent_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
 
 
+def month_of(moment):
+    """The first day (UTC) of ``moment``'s month: a ``UserActivity`` partition."""
+    moment = moment.astimezone(datetime.timezone.utc)
+    return moment.date().replace(day=1)
+
+
 class UserActivity(models.Model):
+    """
+    Append-only event log, written through api.events. On PostgreSQL the
+    table is range-partitioned by ``partition_key`` (one partition per
+    month) so old months are dropped rather than deleted.
+    """
     user = models.ForeignKey('User', on_delete=models.CASCADE)
-    # 'post', 'comment', 'like', etc.
+    # 'join', 'login', 'post', 'comment', 'like', 'follow'
     activity_type = models.CharField(max_length=50)
     content = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    partition_key = models.DateField(editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='event_user_recent_idx'),
+            models.Index(fields=['-created_at', '-id'],
+                         name='event_recent_idx'),
+            models.Index(fields=['partition_key'],
+                         name='event_partition_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.partition_key = month_of(self.created_at)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username}'s {self.activity_type} activity"
@@ -86,6 +222,11 @@ class Like(models.Model):
 
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['created_at'], name='like_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='like_user_recent_idx'),
+        ]
 
 
 class Bookmark(models.Model):
@@ -96,6 +237,11 @@ class Bookmark(models.Model):
 
     class Meta:
         unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['created_at'], name='bookmark_created_idx'),
+            models.Index(fields=['user', '-created_at', '-id'],
+                         name='bookmark_user_recent_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -107,6 +253,96 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            # Covers "who follows X" (fan-out, timeline backfill) without
+            # visiting the table
+            models.Index(fields=['following', 'follower'],
+                         name='follow_following_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """One post in one user's materialized home timeline."""
+    user = models.ForeignKey(
+        User, related_name='timeline_entries', on_delete=models.CASCADE)
+    post = models.ForeignKey(
+        Post, related_name='timeline_entries', on_delete=models.CASCADE)
+    author = models.ForeignKey(
+        User, related_name='+', on_delete=models.CASCADE)
+    # Copy of post.created_at so the feed is a single index range read
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'],
+                         name='timeline_user_recent_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in {self.user_id}'s timeline"
+
+
+class FollowSuggestion(models.Model):
+    """An account ``user`` might follow; maintained by api.suggestions."""
+    user = models.ForeignKey(
+        User, related_name='follow_suggestions', on_delete=models.CASCADE)
+    candidate = models.ForeignKey(
+        User, related_name='+', on_delete=models.CASCADE)
+    # How many of the accounts ``user`` follows follow ``candidate``
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score', 'candidate'],
+                         name='suggestion_user_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate_id} suggested to {self.user_id}"
+
+
+class Blob(models.Model):
+    """A file in content-addressed storage and how many fields reference it; see api.blobs."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='blob_unreferenced_idx',
+                         condition=models.Q(refcount=0)),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount} references)'
+
+
+class DailyRollup(models.Model):
+    """
+    Rows created on one (local) day and the rows existing at its end,
+    filled for finished days by ``manage.py rollup_daily_stats``; see
+    api.analytics.
+    """
+    date = models.DateField(unique=True)
+    signups = models.PositiveIntegerField(default=0)
+    posts = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    bookmarks = models.PositiveIntegerField(default=0)
+    signups_total = models.PositiveIntegerField(default=0)
+    posts_total = models.PositiveIntegerField(default=0)
+    comments_total = models.PositiveIntegerField(default=0)
+    likes_total = models.PositiveIntegerField(default=0)
+    bookmarks_total = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Rollup for {self.date}'
 
 
 class SiteSettings(models.Model):
@@ -127,3 +363,46 @@ class SiteSettings(models.Model):
 
     def __str__(self):
         return f'Site Settings (Last updated: {self.updated_at})'
+
+
+@receiver(post_delete, sender=User)
+def release_avatar(sender, instance, **kwargs):
+    for name in [instance.avatar.name, *instance.avatar_variants.values()]:
+        instance.avatar.storage.delete(name)
+
+
+@receiver(pre_delete, sender=User)
+def note_counted_rows(sender, instance, **kwargs):
+    # The user's likes, bookmarks, comments and follows are counted on other
+    # posts and users; remember which, to recount them once they are gone
+    posts = set()
+    for model, owner in ((Like, 'user'), (Bookmark, 'user'), (Comment, 'author')):
+        posts.update(model.objects.filter(**{owner: instance})
+                     .exclude(post__author=instance)
+                     .values_list('post_id', flat=True))
+    users = set(Follow.objects.filter(follower=instance)
+                .values_list('following_id', flat=True))
+    users.update(Follow.objects.filter(following=instance)
+                 .values_list('follower_id', flat=True))
+    instance._counted_in = (posts, users)
+
+
+@receiver(post_delete, sender=User)
+def recount_counted_rows(sender, instance, **kwargs):
+    posts, users = getattr(instance, '_counted_in', ((), ()))
+    posts, users = sorted(posts), sorted(users)
+    for start in range(0, len(posts), 1000):
+        Post.objects.filter(pk__in=posts[start:start + 1000]).update(
+            likes_count=count_subquery(Like, 'post'),
+            bookmarks_count=count_subquery(Bookmark, 'post'),
+            comments_count=count_subquery(Comment, 'post'))
+    for start in range(0, len(users), 1000):
+        User.objects.filter(pk__in=users[start:start + 1000]).update(
+            followers_count=count_subquery(Follow, 'following'),
+            following_count=count_subquery(Follow, 'follower'))
+    if posts:
+        fragment_cache.bump('post', *posts)
+    if users:
+        fragment_cache.bump('user', *users)
+        # The follow graph cache (api.follow_graph) validates against these
+        fragment_cache.bump('follows', *users)
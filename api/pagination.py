@@ -0,0 +1,181 @@
+import heapq
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a ``(created_at, id)`` keyset.
+
+    The cursor is an opaque encoding of the last row's ordering values, so
+    every page is a ``WHERE (created_at, id) < (...) ORDER BY ... LIMIT n``
+    range read that stops after ``n + 1`` rows no matter how deep it is.
+    Views may set ``ordering`` to page over other columns (the last one must
+    be unique).
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = api_settings.PAGE_SIZE or 20
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None, cursor_query_param=None):
+        if ordering is not None:
+            self.ordering = ordering
+        if cursor_query_param is not None:
+            self.cursor_query_param = cursor_query_param
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.paginate_merged([queryset], request, view)
+
+    def paginate_merged(self, querysets, request, view=None):
+        """
+        Page through several querysets as if they were one.
+
+        Every queryset must expose the ordering columns (as fields or
+        annotations) and all columns must sort in the same direction. Each
+        source is read with the same keyset bound and merged in Python, so
+        the cost is at most ``page_size + 1`` rows per source.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        position = self.decode_cursor(request, querysets[0].model)
+        pages = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*self.ordering)
+            if position is not None:
+                queryset = queryset.filter(self.keyset_filter(position))
+            pages.append(list(queryset[:self.page_size + 1]))
+
+        if len(pages) == 1:
+            return self.finish_page(pages[0])
+        merged = heapq.merge(*pages, key=self.get_position,
+                             reverse=self.ordering[0].startswith('-'))
+        return self.finish_page(list(islice(merged, self.page_size + 1)))
+
+    def paginate_sorted(self, rows, request, view=None):
+        """
+        Page through ``rows``, a list already sorted by the ordering (all
+        columns in one direction), e.g. results ranked in Python.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(view)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            if self.ordering[0].startswith('-'):
+                rows = [row for row in rows if self.get_position(row) < position]
+            else:
+                rows = [row for row in rows if self.get_position(row) > position]
+        return self.finish_page(rows[:self.page_size + 1])
+
+    def finish_page(self, rows):
+        """Trim the look-ahead row and remember where the next page starts."""
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'ordering', None) or self.ordering)
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def keyset_filter(self, position):
+        """
+        Rows strictly after ``position`` in ``self.ordering``.
+
+        The leading column is also bounded on its own (``created_at <= x``)
+        so the planner can turn the predicate into an index range scan.
+        """
+        lookups = [('lt' if field.startswith('-') else 'gt', field.lstrip('-'))
+                   for field in self.ordering]
+        lookup, name = lookups[0]
+        bound = Q(**{f'{name}__{lookup}e': position[0]})
+
+        after = Q()
+        for index, (lookup, name) in enumerate(lookups):
+            clause = Q(**{f'{name}__{lookup}': position[index]})
+            for (_, prefix), value in zip(lookups[:index], position):
+                clause &= Q(**{prefix: value})
+            after |= clause
+        return bound & after
+
+    def encode_cursor(self, position):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value
+                  for value in position]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model=None):
+        """
+        The position encoded in the request's cursor. Values of ``model``
+        fields are converted back to Python; annotations (and everything
+        when there is no model) are used as decoded from JSON.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [self.cursor_value(model, field.lstrip('-'), value)
+                    for field, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def cursor_value(model, name, value):
+        if model is None:
+            return value
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param,
+                                   self.encode_cursor(self.next_position))
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,100 @@
+"""
+The hot access paths of the api app and the index each one must use.
+
+``manage.py check_query_plans`` EXPLAINs every entry of ``PLANS`` (in every
+installed app with a ``query_plans`` module) and fails when a plan does not
+use an index leading with ``columns``, so a query or schema change that
+silently falls back to scanning the table is caught.
+"""
+import datetime
+from collections import namedtuple
+
+from django.utils import timezone
+
+from .analytics import METRICS
+from .models import (Bookmark, Comment, Follow, FollowSuggestion, Like, Post,
+                     TimelineEntry, UserActivity)
+
+QueryPlan = namedtuple('QueryPlan', 'name queryset model columns')
+
+PLANS = [
+    QueryPlan(
+        'post list',
+        lambda: Post.objects.order_by('-created_at', '-id')[:21],
+        Post, ['created_at', 'id']),
+    QueryPlan(
+        'trending posts',
+        lambda: Post.objects.order_by('-trending_score', '-id')[:21],
+        Post, ['trending_score', 'id']),
+    QueryPlan(
+        "user's posts",
+        lambda: Post.objects.filter(author_id=1)
+        .order_by('-created_at', '-id')[:21],
+        Post, ['author_id', 'created_at', 'id']),
+    QueryPlan(
+        'home timeline',
+        lambda: TimelineEntry.objects.filter(user_id=1)
+        .order_by('-created_at', '-post_id')[:21],
+        TimelineEntry, ['user_id', 'created_at', 'post_id']),
+    QueryPlan(
+        "post's comments",
+        lambda: Comment.objects.filter(post_id=1)
+        .order_by('created_at', 'id')[:21],
+        Comment, ['post_id', 'created_at', 'id']),
+    QueryPlan(
+        "user's likes",
+        lambda: Like.objects.filter(user_id=1)
+        .order_by('-created_at', '-id')[:21],
+        Like, ['user_id', 'created_at', 'id']),
+    QueryPlan(
+        "user's comments",
+        lambda: Comment.objects.filter(author_id=1)
+        .order_by('-created_at', '-id')[:21],
+        Comment, ['author_id', 'created_at', 'id']),
+    QueryPlan(
+        "user's bookmarks",
+        lambda: Bookmark.objects.filter(user_id=1)
+        .order_by('-created_at', '-id')[:21],
+        Bookmark, ['user_id', 'created_at', 'id']),
+    QueryPlan(
+        'activity log tail',
+        lambda: UserActivity.objects.order_by('-created_at', '-id')[:21],
+        UserActivity, ['created_at', 'id']),
+    QueryPlan(
+        "user's activity log",
+        lambda: UserActivity.objects.filter(user_id=1)
+        .order_by('-created_at', '-id')[:21],
+        UserActivity, ['user_id', 'created_at', 'id']),
+    QueryPlan(
+        "post's likes",
+        lambda: Like.objects.filter(post_id=1).values('id'),
+        Like, ['post_id']),
+    QueryPlan(
+        "post's bookmarks",
+        lambda: Bookmark.objects.filter(post_id=1).values('id'),
+        Bookmark, ['post_id']),
+    QueryPlan(
+        "user's followers",
+        lambda: Follow.objects.filter(following_id=1).values('follower_id'),
+        Follow, ['following_id', 'follower_id']),
+    QueryPlan(
+        "user's followings",
+        lambda: Follow.objects.filter(follower_id=1).values('following_id'),
+        Follow, ['follower_id', 'following_id']),
+    QueryPlan(
+        "user's follow suggestions",
+        lambda: FollowSuggestion.objects.filter(user_id=1)
+        .order_by('-score', 'candidate_id')[:50],
+        FollowSuggestion, ['user_id', 'score', 'candidate_id']),
+]
+
+# Dashboard counts of rows created since the last daily rollup
+PLANS += [
+    QueryPlan(
+        f'{metric} since last rollup',
+        lambda model=model, field=field: model.objects.filter(**{
+            f'{field}__gte': timezone.now() - datetime.timedelta(days=1),
+        }).values('pk'),
+        model, [field])
+    for metric, (model, field) in METRICS.items()
+]
@@ -0,0 +1,174 @@
+"""
+Full-text search over post titles and content.
+
+On PostgreSQL every post carries a ``search_vector`` column (title weighted
+above content) that a trigger keeps current on insert and update, served by
+a GIN index; matches are ranked with ``ts_rank``. Other backends (SQLite in
+tests and benchmarks) fall back to an in-process inverted index that is
+built from the posts table on first use and updated as posts are written
+through ``api.engagement``; it is only as fresh as the process that holds it.
+
+Either way results come back ordered by ``(rank, id)`` descending, so they
+page with ``KeysetPagination(ordering=ORDERING)``.
+"""
+import math
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+
+from .models import Post
+
+CONFIG = 'english'
+ORDERING = ('-rank', '-id')
+
+# Relative weights of title and content matches, as ts_rank weighs A and B
+TITLE_WEIGHT = 1.0
+CONTENT_WEIGHT = 0.4
+
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its of on or
+that the this to was were will with
+""".split())
+
+TOKEN_RE = re.compile(r'\w+')
+
+Hit = namedtuple('Hit', 'rank id')
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower())
+            if token not in STOP_WORDS]
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+class InvertedIndex:
+    """
+    ``term -> {post_id: weighted term frequency}`` for every indexed post.
+
+    A query matches posts containing all of its terms and scores them by
+    the sum of their weighted frequencies times each term's inverse
+    document frequency.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, post_id, title, content):
+        weights = defaultdict(float)
+        for token in tokenize(title):
+            weights[token] += TITLE_WEIGHT
+        for token in tokenize(content):
+            weights[token] += CONTENT_WEIGHT
+        with self._lock:
+            self._remove(post_id)
+            for term, weight in weights.items():
+                self._postings[term][post_id] = weight
+            self._terms[post_id] = list(weights)
+
+    def remove(self, post_id):
+        with self._lock:
+            self._remove(post_id)
+
+    def _remove(self, post_id):
+        for term in self._terms.pop(post_id, ()):
+            postings = self._postings[term]
+            postings.pop(post_id, None)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, text):
+        """Every matching post as a ``Hit``, best match first."""
+        terms = set(tokenize(text))
+        if not terms:
+            return []
+        with self._lock:
+            postings = [self._postings.get(term, {}) for term in terms]
+            total = len(self._terms)
+        postings.sort(key=len)
+        if not postings[0]:
+            return []
+
+        scores = dict.fromkeys(postings[0], 0.0)
+        for term_postings in postings:
+            idf = math.log(1 + total / len(term_postings))
+            for post_id in list(scores):
+                weight = term_postings.get(post_id)
+                if weight is None:
+                    del scores[post_id]
+                else:
+                    scores[post_id] += weight * idf
+        hits = [Hit(round(score, 6), post_id) for post_id, score in scores.items()]
+        hits.sort(reverse=True)
+        return hits
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def post_index():
+    """The process-wide fallback index, built on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = InvertedIndex()
+                rows = Post.objects.values_list('id', 'title', 'content')
+                for post_id, title, content in rows.iterator(chunk_size=2000):
+                    index.add(post_id, title, content)
+                _index = index
+    return _index
+
+
+def index_post(post):
+    """Reflect a created or edited post in the fallback index."""
+    if uses_postgres() or _index is None:
+        return
+    transaction.on_commit(
+        lambda: _index.add(post.pk, post.title, post.content))
+
+
+def unindex_post(post_id):
+    if uses_postgres() or _index is None:
+        return
+    transaction.on_commit(lambda: _index.remove(post_id))
+
+
+def search_page(text, paginator, request):
+    """
+    One page of posts matching ``text``, best match first, each with its
+    ``rank``. ``paginator`` must be ordered by ``ORDERING``.
+    """
+    if uses_postgres():
+        query = SearchQuery(text, config=CONFIG, search_type='websearch')
+        # ts_rank is a float4, which loses digits on its way through a
+        # cursor; as a float8 the value compared is the one sent
+        posts = (Post.objects.with_author()
+                 .filter(search_vector=query)
+                 .annotate(rank=Cast(SearchRank(F('search_vector'), query),
+                                     FloatField())))
+        return paginator.paginate_queryset(posts, request)
+
+    page = paginator.paginate_sorted(post_index().search(text), request)
+    posts = Post.objects.with_author().in_bulk([hit.id for hit in page])
+    results = []
+    for hit in page:
+        # Posts deleted behind the index's back are skipped
+        post = posts.get(hit.id)
+        if post is not None:
+            post.rank = hit.rank
+            results.append(post)
+    return results
@@ -1,6 +1,161 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 from django.contrib.auth.models import User
-from .models import Post, User, Like, Bookmark, Follow, Comment, SiteSettings
+from django.db.models.manager import BaseManager
+from .models import (Post, User, Like, Bookmark, Follow, Comment, SiteSettings,
+                     UserActivity)
+from . import avatars, events
+from .loaders import get_viewer_state
+from .fragment_cache import fragment_cache
+from .engagement import BATCH_MAX_POSTS
+
+
+class PageListSerializer(serializers.ListSerializer):
+    """
+    Loads per-page state (viewer flags, cached fragments) for every row in
+    one batch before rendering any of them.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, BaseManager) else data)
+        state = get_viewer_state(self.context)
+        if state is not None:
+            self.child.prime_viewer_state(state, items)
+        if isinstance(self.child, FragmentCacheMixin):
+            self.child.prime_fragments(items)
+        return super().to_representation(items)
+
+
+class SparseFieldsMixin:
+    """
+    Lets a response carry only the fields it needs.
+
+    The ``fieldset`` argument limits a serializer to those field names, and
+    on the top-level serializer of a read ``?fields=a,b`` does the same.
+    Relations embedded as a compact card in lists are embedded in full when
+    named in ``?expand=``. Dropped fields are never computed.
+    """
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        self.fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        wanted = self.requested_names('fields')
+        if wanted is None:
+            wanted = self.fieldset
+        if wanted is not None:
+            fields = {name: field for name, field in fields.items()
+                      if name in wanted}
+        return fields
+
+    def requested_names(self, param):
+        """Names listed in query ``param``, for the top-level serializer."""
+        request = self.context.get('request')
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if (parent is not None or request is None
+                or request.method not in SAFE_METHODS):
+            return None
+        value = getattr(request, 'query_params', {}).get(param)
+        if value is None:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def embeds_compact(self, name):
+        """Whether relation ``name`` is rendered as a compact card."""
+        if not isinstance(self.parent, serializers.ListSerializer):
+            return False
+        return name not in (self.requested_names('expand') or ())
+
+
+class FragmentCacheMixin:
+    """
+    Serves the viewer-independent part of a representation from the
+    fragment cache and merges the viewer's flags back in afterwards.
+
+    Subclasses set ``fragment_kind`` and implement ``strip_viewer_state``
+    and ``merge_viewer_state``; ``fragment_sources`` lists every row whose
+    version the fragment depends on.
+    """
+    fragment_kind = None
+
+    def fragment_sources(self, instance):
+        return [(self.fragment_kind, instance.pk)]
+
+    def fragment_shape(self):
+        """The (nested) field names a fragment of this serializer holds."""
+        if not hasattr(self, '_fragment_shape'):
+            parts = []
+            for name, field in self.fields.items():
+                if field.write_only:
+                    continue
+                if isinstance(field, FragmentCacheMixin):
+                    name = f'{name}({field.fragment_shape()})'
+                parts.append(name)
+            self._fragment_shape = ','.join(parts)
+        return self._fragment_shape
+
+    def _fragment_state(self):
+        return self.context.setdefault(
+            'fragment_cache', {'versions': {}, 'fragments': {}})
+
+    def _load_versions(self, instances):
+        known = self._fragment_state()['versions']
+        wanted = {source for instance in instances
+                  for source in self.fragment_sources(instance)
+                  if source not in known}
+        if wanted:
+            known.update(fragment_cache.source_versions(wanted))
+
+    def get_fragment_key(self, instance):
+        self._load_versions([instance])
+        known = self._fragment_state()['versions']
+        versions = [known[source] for source in self.fragment_sources(instance)]
+        # Absolute URLs in the payload depend on the host it was built for
+        request = self.context.get('request')
+        shape = f'{type(self).__name__}:{self.fragment_shape()}'
+        if request is not None:
+            shape += request.build_absolute_uri('/')
+        return fragment_cache.fragment_key(
+            self.fragment_kind, instance.pk, versions, shape)
+
+    def prime_fragments(self, instances):
+        if not fragment_cache.enabled or not instances:
+            return
+        self._load_versions(instances)
+        keys = [self.get_fragment_key(instance) for instance in instances]
+        found = fragment_cache.get_many(keys)
+        # Misses are remembered too so rendering does not look them up again
+        self._fragment_state()['fragments'].update(
+            {key: found.get(key) for key in keys})
+
+    def to_representation(self, instance):
+        if not fragment_cache.enabled:
+            return super().to_representation(instance)
+
+        key = self.get_fragment_key(instance)
+        fragments = self._fragment_state()['fragments']
+        if key not in fragments:
+            fragments[key] = fragment_cache.get_many([key]).get(key)
+        data = fragments[key]
+        if data is None:
+            data = self.strip_viewer_state(super().to_representation(instance))
+            fragments[key] = data
+            fragment_cache.set_many({key: data})
+        # Cached dicts are shared, so merging must copy what it changes
+        return self.merge_viewer_state(data, instance)
+
+
+def avatar_url(user, size, context):
+    """``user``'s avatar sized for ``size`` px, absolute when there is a request."""
+    url = user.get_avatar_url(size)
+    request = context.get('request')
+    if url and request:
+        return request.build_absolute_uri(url)
+    return url
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -11,26 +166,22 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ['bio', 'avatar', 'website', 'avatar_url']
 
     def get_avatar_url(self, obj):
-        if obj.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.avatar.url)
-            return obj.avatar.url
-        return None
+        return avatar_url(obj, avatars.PROFILE_SIZE, self.context)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, FragmentCacheMixin,
+                     serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField()
     password = serializers.CharField(write_only=True, required=False)
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
-    posts_count = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'password', 'bio', 'avatar',
                   'website', 'date_joined', 'followers_count', 'following_count',
-                  'posts_count', 'is_staff', 'avatar_url')
+                  'posts_count', 'is_staff', 'avatar_url', 'is_following')
+        read_only_fields = ('followers_count', 'following_count', 'posts_count')
+        list_serializer_class = PageListSerializer
         extra_kwargs = {
             'password': {'write_only': True},
             'email': {'required': False},
@@ -40,22 +191,41 @@ class UserSerializer(serializers.ModelSerializer):
             'website': {'required': False}
         }
 
-    def get_followers_count(self, obj):
-        return obj.followers.count()
+    fragment_kind = 'user'
+
+    # How posts and comments embed their author in lists (with
+    # ``avatar_size=avatars.CARD_SIZE``)
+    CARD_FIELDS = ('id', 'username', 'avatar_url')
+
+    def __init__(self, *args, avatar_size=avatars.PROFILE_SIZE, **kwargs):
+        self.avatar_size = avatar_size
+        super().__init__(*args, **kwargs)
+
+    def fragment_shape(self):
+        # avatar_url depends on the size as well as on the fields
+        return f'{super().fragment_shape()}@{self.avatar_size}'
 
-    def get_following_count(self, obj):
-        return obj.following.count()
+    def prime_viewer_state(self, state, users):
+        if 'is_following' in self.fields:
+            state.prime(following=[user.id for user in users])
 
-    def get_posts_count(self, obj):
-        return obj.post_set.count()
+    def strip_viewer_state(self, data):
+        data.pop('is_following', None)
+        return data
+
+    def merge_viewer_state(self, data, instance):
+        if 'is_following' not in self.fields:
+            return data
+        return {**data, 'is_following': self.get_is_following(instance)}
+
+    def get_is_following(self, obj):
+        state = get_viewer_state(self.context)
+        if state is None:
+            return False
+        return state.is_following(obj.id)
 
     def get_avatar_url(self, obj):
-        if obj.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.avatar.url)
-            return obj.avatar.url
-        return None
+        return avatar_url(obj, self.avatar_size, self.context)
 
     def create(self, validated_data):
         if 'password' not in validated_data:
@@ -72,12 +242,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
         # Create initial activity record
-        from .models import UserActivity
-        UserActivity.objects.create(
-            user=user,
-            activity_type='join',
-            content=f'User {user.username} joined the platform'
-        )
+        events.append(user, 'join', f'User {user.username} joined the platform')
 
         return user
 
@@ -95,11 +260,9 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsMixin, FragmentCacheMixin,
+                     serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    likes_count = serializers.SerializerMethodField()
-    bookmarks_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     is_bookmarked = serializers.SerializerMethodField()
 
@@ -107,27 +270,76 @@ class PostSerializer(serializers.ModelSerializer):
         model = Post
         fields = ['id', 'title', 'content', 'author', 'created_at', 'updated_at',
                   'likes_count', 'bookmarks_count', 'comments_count', 'is_liked', 'is_bookmarked']
-
-    def get_likes_count(self, obj):
-        return obj.post_likes.count()
-
-    def get_bookmarks_count(self, obj):
-        return obj.post_bookmarks.count()
-
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+        read_only_fields = ['likes_count', 'bookmarks_count', 'comments_count']
+        list_serializer_class = PageListSerializer
+
+    fragment_kind = 'post'
+
+    # Counter -> ViewerState relation whose buffered writes it reflects
+    PENDING_COUNTERS = {'likes_count': 'liked', 'bookmarks_count': 'bookmarked'}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if 'author' in fields and self.embeds_compact('author'):
+            fields['author'] = UserSerializer(
+                read_only=True, fieldset=UserSerializer.CARD_FIELDS,
+                avatar_size=avatars.CARD_SIZE)
+        return fields
+
+    def prime_viewer_state(self, state, posts):
+        post_ids = [post.id for post in posts]
+        if 'is_liked' in self.fields:
+            state.prime(liked=post_ids)
+        if 'is_bookmarked' in self.fields:
+            state.prime(bookmarked=post_ids)
+        if 'author' in self.fields:
+            self.fields['author'].prime_viewer_state(
+                state, [post.author for post in posts])
+
+    def fragment_sources(self, instance):
+        return [('post', instance.pk), ('user', instance.author_id)]
+
+    def strip_viewer_state(self, data):
+        data.pop('is_liked', None)
+        data.pop('is_bookmarked', None)
+        if 'author' in data:
+            data['author'] = self.fields['author'].strip_viewer_state(
+                dict(data['author']))
+        return data
+
+    def merge_viewer_state(self, data, instance):
+        data = dict(data)
+        if 'author' in data:
+            data['author'] = self.fields['author'].merge_viewer_state(
+                data['author'], instance.author)
+        if 'is_liked' in self.fields:
+            data['is_liked'] = self.get_is_liked(instance)
+        if 'is_bookmarked' in self.fields:
+            data['is_bookmarked'] = self.get_is_bookmarked(instance)
+        return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        state = get_viewer_state(self.context)
+        if state is not None:
+            # The counters as they will be once the viewer's writes flush
+            for counter, relation in self.PENDING_COUNTERS.items():
+                if counter in data:
+                    data[counter] = max(
+                        data[counter] + state.counter_delta(relation, instance.id), 0)
+        return data
 
     def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.post_likes.filter(user=request.user).exists()
-        return False
+        state = get_viewer_state(self.context)
+        if state is None:
+            return False
+        return state.is_liked(obj.id)
 
     def get_is_bookmarked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.post_bookmarks.filter(user=request.user).exists()
-        return False
+        state = get_viewer_state(self.context)
+        if state is None:
+            return False
+        return state.is_bookmarked(obj.id)
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -142,29 +354,63 @@ class BookmarkSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'post', 'created_at']
 
 
+class UserActivitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserActivity
+        fields = ['id', 'user', 'activity_type', 'content', 'created_at']
+
+
 class FollowSerializer(serializers.ModelSerializer):
     class Meta:
         model = Follow
         fields = ['id', 'follower', 'following', 'created_at']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
-    author_avatar = serializers.SerializerMethodField()
 
     class Meta:
         model = Comment
-        fields = ['id', 'post', 'author', 'author_avatar',
-                  'content', 'created_at', 'updated_at']
+        fields = ['id', 'post', 'author', 'content', 'created_at', 'updated_at']
         read_only_fields = ['author']
-
-    def get_author_avatar(self, obj):
-        if obj.author.avatar:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.author.avatar.url)
-            return obj.author.avatar.url
-        return None
+        list_serializer_class = PageListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if 'author' in fields and self.embeds_compact('author'):
+            fields['author'] = UserSerializer(
+                read_only=True, fieldset=UserSerializer.CARD_FIELDS,
+                avatar_size=avatars.COMMENT_SIZE)
+        return fields
+
+    def prime_viewer_state(self, state, comments):
+        if 'author' in self.fields:
+            self.fields['author'].prime_viewer_state(
+                state, [comment.author for comment in comments])
+
+
+class EngagementBatchSerializer(serializers.Serializer):
+    """Post IDs to switch a like or bookmark on (``add``) and off (``remove``)."""
+    add = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+        max_length=BATCH_MAX_POSTS)
+    remove = serializers.ListField(
+        child=serializers.IntegerField(), required=False, default=list,
+        max_length=BATCH_MAX_POSTS)
+
+    def validate(self, data):
+        if not data['add'] and not data['remove']:
+            raise serializers.ValidationError('Nothing to add or remove.')
+        # A repeated ID is one change, not one event per occurrence
+        data['add'] = list(dict.fromkeys(data['add']))
+        data['remove'] = list(dict.fromkeys(data['remove']))
+        if set(data['add']) & set(data['remove']):
+            raise serializers.ValidationError(
+                'A post cannot be both added and removed.')
+        if len(set(data['add']) | set(data['remove'])) > BATCH_MAX_POSTS:
+            raise serializers.ValidationError(
+                f'At most {BATCH_MAX_POSTS} posts per request.')
+        return data
 
 
 class SiteSettingsSerializer(serializers.ModelSerializer):
@@ -0,0 +1,102 @@
+"""
+Single-statement writes the ORM cannot express.
+
+PostgreSQL and SQLite (3.35+) both support ``ON CONFLICT DO NOTHING`` and
+``RETURNING``, so each helper is one round trip that also reports what it
+changed, with no SELECT before or after it and no IntegrityError to catch
+when two identical requests race.
+"""
+from django.db import connection
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _where(model, filters):
+    """``col = %s AND ...`` for equality filters; model instances match by pk."""
+    clauses, params = [], []
+    for name, value in filters.items():
+        clauses.append(f'{_quote(model._meta.get_field(name).column)} = %s')
+        params.append(getattr(value, 'pk', value))
+    return ' AND '.join(clauses), params
+
+
+def insert_ignore(model, **values):
+    """
+    Insert one ``model`` row unless it would violate a unique constraint.
+    Returns whether a row was inserted.
+    """
+    instance = model(**values)
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key]
+    params = [field.get_db_prep_save(field.pre_save(instance, add=True), connection)
+              for field in fields]
+    sql = (f'INSERT INTO {_quote(model._meta.db_table)} '
+           f'({", ".join(_quote(field.column) for field in fields)}) '
+           f'VALUES ({", ".join(["%s"] * len(fields))}) '
+           f'ON CONFLICT DO NOTHING '
+           f'RETURNING {_quote(model._meta.pk.column)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone() is not None
+
+
+def delete_returning(model, **filters):
+    """
+    Delete the ``model`` rows matching the equality ``filters`` without
+    loading them. Returns the primary keys deleted.
+    """
+    where, params = _where(model, filters)
+    sql = (f'DELETE FROM {_quote(model._meta.db_table)} WHERE {where} '
+           f'RETURNING {_quote(model._meta.pk.column)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def increment_returning(model, pk, field_name, delta):
+    """
+    Add ``delta`` to ``field_name`` of one row and return the new value,
+    or None if the row does not exist.
+    """
+    column = _quote(model._meta.get_field(field_name).column)
+    sql = (f'UPDATE {_quote(model._meta.db_table)} '
+           f'SET {column} = {column} + %s '
+           f'WHERE {_quote(model._meta.pk.column)} = %s '
+           f'RETURNING {column}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [delta, pk])
+        row = cursor.fetchone()
+    return None if row is None else row[0]
+
+
+def insert_ignore_many(model, rows, returning, batch_size=300):
+    """
+    Insert ``model`` rows given as dicts of field values, skipping those
+    that would violate a unique constraint. Returns the ``returning``
+    field values of the rows actually inserted, as tuples.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key]
+    columns = ', '.join(_quote(model._meta.get_field(name).column)
+                        for name in returning)
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            params = []
+            for values in rows[start:start + batch_size]:
+                instance = model(**values)
+                params.extend(
+                    field.get_db_prep_save(field.pre_save(instance, add=True), connection)
+                    for field in fields)
+            count = len(params) // len(fields)
+            placeholders = ', '.join(
+                [f'({", ".join(["%s"] * len(fields))})'] * count)
+            cursor.execute(
+                f'INSERT INTO {_quote(model._meta.db_table)} '
+                f'({", ".join(_quote(field.column) for field in fields)}) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT DO NOTHING RETURNING {columns}', params)
+            inserted.extend(tuple(row) for row in cursor.fetchall())
+    return inserted
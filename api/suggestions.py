@@ -0,0 +1,164 @@
+"""
+Who-to-follow suggestions.
+
+``FollowSuggestion`` stores, per user, the accounts followed by the people
+they follow, scored by how many of them do. ``rebuild`` computes every
+user's top ``FOLLOW_SUGGESTIONS_PER_USER`` in one pass over ``Follow``:
+each user's followings are held as a compact ``array`` of IDs, and the
+two-hop candidates of a user are counted with ``Counter.update`` over the
+arrays of the accounts they follow, minus the set they already follow.
+
+Between rebuilds ``followed`` and ``unfollowed`` apply each follow change
+with a few set-based statements: the follower gains or loses the followed
+account's followings as candidates, and the follower's own followers gain
+or lose the followed account. Incremental updates may leave more than the
+top N rows for a user; reads only take the best ones and the next rebuild
+trims the rest.
+"""
+import heapq
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from .models import Follow, FollowSuggestion, User
+
+BATCH_SIZE = 500
+
+
+def per_user():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_PER_USER', 50)
+
+
+def fanout_limit():
+    return getattr(settings, 'FOLLOW_SUGGESTIONS_FANOUT_MAX_FOLLOWERS', 5000)
+
+
+def following_arrays():
+    """``{user_id: array of followed IDs}`` for every user who follows anyone."""
+    following = defaultdict(lambda: array('q'))
+    rows = (Follow.objects.order_by().values_list('follower_id', 'following_id')
+            .iterator(chunk_size=10000))
+    for follower_id, following_id in rows:
+        following[follower_id].append(following_id)
+    return dict(following)
+
+
+def top_candidates(user_id, following, limit):
+    """``[(candidate_id, score)]`` for one user, best first (lowest ID on ties)."""
+    followed = following.get(user_id)
+    if not followed:
+        return []
+    counts = Counter()
+    for followed_id in followed:
+        counts.update(following.get(followed_id, ()))
+    for excluded in {user_id, *followed}:
+        counts.pop(excluded, None)
+    return heapq.nsmallest(limit, counts.items(),
+                           key=lambda item: (-item[1], item[0]))
+
+
+def rebuild(user_ids=None):
+    """
+    Recompute the stored suggestions of ``user_ids`` (everyone by default)
+    from the current follow graph. Returns the number of users processed.
+    """
+    following = following_arrays()
+    limit = per_user()
+    if user_ids is None:
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        rows = [FollowSuggestion(user_id=user_id, candidate_id=candidate_id,
+                                 score=score)
+                for user_id in batch
+                for candidate_id, score in top_candidates(user_id, following, limit)]
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(user_id__in=batch).delete()
+            FollowSuggestion.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(user_ids)
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _add_candidates(select, params):
+    """
+    Add one to the score of every ``(user_id, candidate_id)`` pair ``select``
+    yields, inserting the missing pairs: one ``INSERT ... SELECT ... ON
+    CONFLICT DO UPDATE``.
+    """
+    table = _quote(FollowSuggestion._meta.db_table)
+    sql = (f'INSERT INTO {table} (user_id, candidate_id, score) {select} '
+           f'ON CONFLICT (user_id, candidate_id) '
+           f'DO UPDATE SET score = {table}.score + 1')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def followed(follower, following):
+    """Apply ``follower`` starting to follow ``following``."""
+    follows = _quote(Follow._meta.db_table)
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(
+            user=follower, candidate=following).delete()
+        # The follower gains what the followed account follows...
+        _add_candidates(
+            f'SELECT %s, following_id, 1 FROM {follows} '
+            f'WHERE follower_id = %s AND following_id <> %s '
+            f'AND following_id NOT IN '
+            f'(SELECT following_id FROM {follows} WHERE follower_id = %s)',
+            [follower.pk, following.pk, follower.pk, follower.pk])
+        # ...and the follower's followers gain the followed account
+        if follower.followers_count <= fanout_limit():
+            _add_candidates(
+                f'SELECT follower_id, %s, 1 FROM {follows} '
+                f'WHERE following_id = %s AND follower_id <> %s '
+                f'AND follower_id NOT IN '
+                f'(SELECT follower_id FROM {follows} WHERE following_id = %s)',
+                [following.pk, follower.pk, following.pk, following.pk])
+
+
+def unfollowed(follower, following):
+    """Apply ``follower`` no longer following ``following``."""
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(
+            user=follower,
+            candidate__in=Follow.objects.filter(
+                follower=following).values('following'),
+        ).update(score=F('score') - 1)
+        if follower.followers_count <= fanout_limit():
+            FollowSuggestion.objects.filter(
+                user__in=Follow.objects.filter(
+                    following=follower).values('follower'),
+                candidate=following,
+            ).update(score=F('score') - 1)
+        FollowSuggestion.objects.filter(
+            Q(user=follower) | Q(candidate=following), score__lte=0).delete()
+
+        # The unfollowed account is a candidate again if others follow it
+        score = Follow.objects.filter(
+            following=following,
+            follower__in=Follow.objects.filter(
+                follower=follower).values('following'),
+        ).count()
+        if score:
+            FollowSuggestion.objects.bulk_create(
+                [FollowSuggestion(user=follower, candidate=following,
+                                  score=score)],
+                update_conflicts=True, unique_fields=['user', 'candidate'],
+                update_fields=['score'])
+
+
+def for_user(user, limit=None):
+    """``user``'s best suggestions, with the candidates loaded."""
+    limit = min(limit or per_user(), per_user())
+    return (FollowSuggestion.objects.filter(user=user)
+            .exclude(candidate__in=Follow.objects.filter(
+                follower=user).values('following'))
+            .select_related('candidate')
+            .order_by('-score', 'candidate_id')[:limit])
@@ -0,0 +1,359 @@
+import datetime
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import blobs, write_behind
+from .models import Blob, Comment, Like, Post, TimelineEntry, User, UserActivity
+
+
+def make_user(username, **extra):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='pw', **extra)
+
+
+def client_for(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.posts = [Post.objects.create(title=f'Post {n}', content='text',
+                                          author=self.author)
+                      for n in range(7)]
+        # Rows sharing created_at are told apart by id at page boundaries
+        Post.objects.update(created_at=timezone.now())
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = client_for().get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_every_row_once(self):
+        ids = self.walk('/api/posts/?page_size=3')
+        self.assertEqual(ids, sorted((post.pk for post in self.posts), reverse=True))
+
+    def test_page_size_is_capped(self):
+        response = client_for().get('/api/posts/?page_size=0')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = client_for().get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        client_for(self.reader).post(f'/api/users/{self.author.username}/follow/')
+
+    def publish(self, count):
+        # Loaded afresh, as each request loads its user
+        client = client_for(User.objects.get(pk=self.author.pk))
+        return [client.post('/api/posts/', {'title': f'Post {n}', 'content': 'text'}).data['id']
+                for n in range(count)]
+
+    def feed_ids(self):
+        response = client_for(self.reader).get('/api/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']]
+
+    def test_posts_are_fanned_out_to_followers(self):
+        ids = self.publish(3)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.reader).values_list('post_id', flat=True)),
+            set(ids))
+        self.assertEqual(self.feed_ids(), ids[::-1])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=3, TIMELINE_TRIM_EVERY=1)
+    def test_fan_out_trims_timelines(self):
+        ids = self.publish(5)
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=self.reader)
+                 .order_by('-post_id').values_list('post_id', flat=True)),
+            ids[:-4:-1])
+
+    @override_settings(TIMELINE_FANOUT_MAX_FOLLOWERS=0)
+    def test_posts_of_popular_authors_are_merged_on_read(self):
+        ids = self.publish(2)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed_ids(), ids[::-1])
+
+    def test_unfollow_removes_the_author_from_the_feed(self):
+        self.publish(2)
+        client_for(self.reader).post(f'/api/users/{self.author.username}/unfollow/')
+        self.assertEqual(self.feed_ids(), [])
+
+
+class PostCounterTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.post = Post.objects.create(title='Post', content='text', author=self.author)
+
+    def counters(self):
+        self.post.refresh_from_db()
+        return self.post.likes_count, self.post.bookmarks_count, self.post.comments_count
+
+    def test_likes_and_bookmarks_count_once_per_user(self):
+        client = client_for(self.reader)
+        for _ in range(2):
+            client.post(f'/api/posts/{self.post.pk}/like/')
+            client.post(f'/api/posts/{self.post.pk}/bookmark/')
+        self.assertEqual(self.counters(), (1, 1, 0))
+        for _ in range(2):
+            response = client.delete(f'/api/posts/{self.post.pk}/like/')
+            client.delete(f'/api/posts/{self.post.pk}/bookmark/')
+        self.assertEqual(response.data['likes_count'], 0)
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_comments_are_counted(self):
+        client = client_for(self.reader)
+        response = client.post('/api/comments/', {'post': self.post.pk, 'content': 'Nice'})
+        client.post('/api/comments/', {'post': self.post.pk, 'content': 'Again'})
+        self.assertEqual(self.counters(), (0, 0, 2))
+        client.delete(f'/api/comments/{response.data["id"]}/')
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+    def test_recount_repairs_drift(self):
+        Comment.objects.create(post=self.post, author=self.reader, content='Nice')
+        Post.objects.filter(pk=self.post.pk).update(likes_count=5, comments_count=0)
+        call_command('recount_engagement', stdout=StringIO())
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+
+class UserCounterTests(TestCase):
+    def setUp(self):
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+
+    def counters(self, user):
+        user.refresh_from_db()
+        return user.followers_count, user.following_count, user.posts_count
+
+    def test_follows_are_counted_on_both_sides(self):
+        client = client_for(self.reader)
+        for _ in range(2):
+            client.post(f'/api/users/{self.author.username}/follow/')
+        self.assertEqual(self.counters(self.author), (1, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 1, 0))
+        client.post(f'/api/users/{self.author.username}/unfollow/')
+        self.assertEqual(self.counters(self.author), (0, 0, 0))
+        self.assertEqual(self.counters(self.reader), (0, 0, 0))
+
+    def test_posts_are_counted(self):
+        client = client_for(self.author)
+        response = client.post('/api/posts/', {'title': 'Post', 'content': 'text'})
+        self.assertEqual(response.data['author']['posts_count'], 1)
+        client.post('/api/posts/', {'title': 'Another', 'content': 'text'})
+        client.delete(f'/api/posts/{response.data["id"]}/')
+        self.assertEqual(self.counters(self.author), (0, 0, 1))
+
+    def test_deleting_a_user_recounts_what_their_rows_counted_in(self):
+        response = client_for(self.author).post('/api/posts/', {'title': 'Post', 'content': 'text'})
+        post = Post.objects.get(pk=response.data['id'])
+        client = client_for(self.reader)
+        client.post(f'/api/users/{self.author.username}/follow/')
+        client_for(self.author).post(f'/api/users/{self.reader.username}/follow/')
+        client.post(f'/api/posts/{post.pk}/like/')
+        client.post(f'/api/posts/{post.pk}/bookmark/')
+        client.post('/api/comments/', {'post': post.pk, 'content': 'Nice'})
+        self.reader.delete()
+        post.refresh_from_db()
+        self.assertEqual((post.likes_count, post.bookmarks_count, post.comments_count),
+                         (0, 0, 0))
+        self.assertEqual(self.counters(self.author), (0, 0, 1))
+
+    def test_recount_repairs_drift(self):
+        Post.objects.create(title='Post', content='text', author=self.author)
+        Like.objects.create(user=self.reader, post=Post.objects.get())
+        User.objects.filter(pk=self.author.pk).update(followers_count=3, posts_count=0)
+        call_command('recount_user_counters', stdout=StringIO())
+        self.assertEqual(self.counters(self.author), (0, 0, 1))
+
+
+class AnalyticsSeriesTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin', is_staff=True)
+        author = make_user('author')
+        today = timezone.localdate()
+        for days_ago in (0, 2, 2):
+            post = Post.objects.create(title='Post', content='text', author=author)
+            moment = timezone.make_aware(datetime.datetime.combine(
+                today - datetime.timedelta(days=days_ago), datetime.time(12)))
+            Post.objects.filter(pk=post.pk).update(created_at=moment)
+        self.today = today
+
+    def analytics(self, **params):
+        response = client_for(self.admin).get('/api/admin/analytics/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_days_without_rows_are_zero(self):
+        start = self.today - datetime.timedelta(days=3)
+        data = self.analytics(start=start.isoformat(), end=self.today.isoformat(),
+                              interval='day')
+        self.assertEqual(data['dates'], [
+            (start + datetime.timedelta(days=n)).isoformat() for n in range(4)])
+        self.assertEqual(data['posts'], [0, 2, 0, 1])
+
+    def test_buckets_group_days(self):
+        data = self.analytics(start=self.today.isoformat(), end=self.today.isoformat(),
+                              interval='month')
+        self.assertEqual(data['dates'], [self.today.strftime('%Y-%m')])
+        self.assertEqual(data['posts'], [3 if self.today.day > 2 else 1])
+
+    def test_invalid_ranges_are_rejected(self):
+        response = client_for(self.admin).get(
+            '/api/admin/analytics/', {'start': '2024-02-01', 'end': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(ENGAGEMENT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL': 3600})
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        write_behind._buffer = None
+        self.addCleanup(setattr, write_behind, '_buffer', None)
+        self.author = make_user('author')
+        self.reader = make_user('reader')
+        self.post = Post.objects.create(title='Post', content='text', author=self.author)
+        self.client = client_for(self.reader)
+
+    def liked(self):
+        return Like.objects.filter(user=self.reader, post=self.post).exists()
+
+    def likes_count(self):
+        self.post.refresh_from_db()
+        return self.post.likes_count
+
+    def test_toggles_are_coalesced_until_flushed(self):
+        for method in ('post', 'delete', 'post'):
+            response = getattr(self.client, method)(f'/api/posts/{self.post.pk}/like/')
+        self.assertEqual(response.data['likes_count'], 1)
+        self.assertFalse(self.liked())
+        detail = self.client.get(f'/api/posts/{self.post.pk}/').data
+        self.assertEqual((detail['is_liked'], detail['likes_count']), (True, 1))
+
+        self.assertEqual(write_behind.flush(), 1)
+        self.assertTrue(self.liked())
+        self.assertEqual(self.likes_count(), 1)
+
+    def test_batch_after_buffered_toggle_wins(self):
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        response = self.client.post('/api/posts/batch/like/',
+                                    {'remove': [self.post.pk]}, format='json')
+        self.assertEqual(response.data['results'], [
+            {'id': self.post.pk, 'is_liked': False, 'likes_count': 0}])
+        self.assertFalse(self.client.get(f'/api/posts/{self.post.pk}/').data['is_liked'])
+
+        write_behind.flush()
+        self.assertFalse(self.liked())
+        self.assertEqual(self.likes_count(), 0)
+
+    def test_failed_flush_keeps_states_and_newer_ones_win(self):
+        buffer = write_behind.get_buffer()
+        buffer.put('like', self.reader.pk, self.post.pk, True)
+        with mock.patch.object(write_behind.engagement, 'apply_states',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                write_behind.flush()
+        self.assertEqual(buffer.pending('like', self.reader.pk, [self.post.pk]),
+                         {self.post.pk: True})
+
+        self.assertEqual(buffer.drain(), {('like', self.reader.pk, self.post.pk): True})
+        self.assertIsNone(buffer.drain())
+        buffer.put('like', self.reader.pk, self.post.pk, False)
+        buffer.abort()
+        write_behind.flush()
+        self.assertFalse(self.liked())
+
+
+@override_settings(ENGAGEMENT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL': 3600})
+class LikeEventTests(TestCase):
+    def setUp(self):
+        write_behind._buffer = None
+        self.addCleanup(setattr, write_behind, '_buffer', None)
+        self.reader = make_user('reader')
+        self.post = Post.objects.create(
+            title='Post', content='text', author=make_user('author'))
+
+    def like_events(self):
+        return UserActivity.objects.filter(user=self.reader, activity_type='like').count()
+
+    def test_only_new_likes_are_logged(self):
+        client_for(self.reader).post(f'/api/posts/{self.post.pk}/like/')
+        write_behind.flush()
+        self.assertEqual(self.like_events(), 1)
+
+        write_behind.get_buffer().put('like', self.reader.pk, self.post.pk, True)
+        write_behind.flush()
+        self.assertEqual(self.like_events(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+
+class BlobRefcountTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.storage = blobs.content_storage()
+
+    def upload_avatar(self, user, content):
+        user.avatar = SimpleUploadedFile('avatar.png', content, content_type='image/png')
+        user.save()
+        return User.objects.get(pk=user.pk)
+
+    def refcounts(self):
+        return dict(Blob.objects.values_list('name', 'refcount'))
+
+    def test_identical_content_is_stored_once(self):
+        first = self.upload_avatar(make_user('first'), b'same bytes')
+        second = self.upload_avatar(make_user('second'), b'same bytes')
+        self.assertEqual(first.avatar.name, second.avatar.name)
+        self.assertEqual(self.refcounts(), {first.avatar.name: 2})
+        self.assertTrue(self.storage.exists(first.avatar.name))
+
+    def test_reuploading_an_identical_avatar_keeps_one_reference(self):
+        user = make_user('user')
+        for _ in range(3):
+            user = self.upload_avatar(user, b'same bytes')
+        self.assertEqual(self.refcounts(), {user.avatar.name: 1})
+        self.assertEqual(blobs.recount(), 0)
+
+    def test_replaced_and_deleted_avatars_are_released_and_collected(self):
+        user = self.upload_avatar(make_user('user'), b'old bytes')
+        old = user.avatar.name
+        user = self.upload_avatar(user, b'new bytes')
+        new = user.avatar.name
+        self.assertEqual(self.refcounts(), {old: 0, new: 1})
+
+        user.delete()
+        self.assertEqual(self.refcounts(), {old: 0, new: 0})
+        self.assertEqual(blobs.collect(), (2, 0))
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(self.storage.exists(old) or self.storage.exists(new))
+
+    def test_recount_repairs_drift(self):
+        user = self.upload_avatar(make_user('user'), b'bytes')
+        Blob.objects.update(refcount=5)
+        self.assertEqual(blobs.recount(), 1)
+        self.assertEqual(self.refcounts(), {user.avatar.name: 1})
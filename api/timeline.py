@@ -0,0 +1,142 @@
+"""
+Materialized home timelines.
+
+A new post is written into each follower's timeline (fan-out on write), so
+reading ``/feed/`` is one range read over ``TimelineEntry``. Authors with
+more than ``TIMELINE_FANOUT_MAX_FOLLOWERS`` followers are not fanned out;
+their posts are merged into the feed when it is read instead.
+
+Each timeline is capped at ``TIMELINE_MAX_ENTRIES``. Trimming costs two
+queries, so fan-out trims a random ``1/TIMELINE_TRIM_EVERY`` of the
+recipients of each post rather than all of them: a timeline exceeds the
+cap by about ``TIMELINE_TRIM_EVERY`` entries at most, on average.
+"""
+import random
+
+from django.conf import settings
+from django.db.models import F, Q
+
+from .follow_graph import follow_graph
+from .models import Follow, Post, TimelineEntry, User
+
+BATCH_SIZE = 1000
+
+
+def max_entries():
+    return getattr(settings, 'TIMELINE_MAX_ENTRIES', 800)
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 5000)
+
+
+def trim_every():
+    return max(getattr(settings, 'TIMELINE_TRIM_EVERY', 50), 1)
+
+
+def is_fanout_author(user):
+    return user.followers_count <= fanout_limit()
+
+
+def _entries_for(post, user_ids):
+    return [TimelineEntry(user_id=user_id, post=post, author_id=post.author_id,
+                          created_at=post.created_at)
+            for user_id in user_ids]
+
+
+def fan_out_post(post):
+    """Write ``post`` into its author's followers' timelines."""
+    if not is_fanout_author(post.author):
+        return
+    follower_ids = (Follow.objects.filter(following_id=post.author_id)
+                    .values_list('follower_id', flat=True)
+                    .iterator(chunk_size=BATCH_SIZE))
+    batch = []
+    for follower_id in follower_ids:
+        batch.append(follower_id)
+        if len(batch) == BATCH_SIZE:
+            _deliver(post, batch)
+            batch = []
+    if batch:
+        _deliver(post, batch)
+
+
+def _deliver(post, user_ids):
+    TimelineEntry.objects.bulk_create(
+        _entries_for(post, user_ids), ignore_conflicts=True)
+    every = trim_every()
+    for user_id in user_ids:
+        if random.randrange(every) == 0:
+            trim(user_id)
+
+
+def add_author(user, author):
+    """Backfill ``author``'s recent posts after ``user`` follows them."""
+    if not is_fanout_author(author):
+        return
+    posts = Post.objects.filter(author=author).order_by(
+        '-created_at', '-id')[:max_entries()]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=user, post=post, author=author,
+                       created_at=post.created_at) for post in posts],
+        ignore_conflicts=True)
+    trim(user.id)
+
+
+def remove_author(user, author):
+    """Drop ``author``'s posts after ``user`` unfollows them."""
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def trim(user_id):
+    """Keep only the newest ``TIMELINE_MAX_ENTRIES`` entries for a user."""
+    cap = max_entries()
+    cutoff = (TimelineEntry.objects.filter(user_id=user_id)
+              .order_by('-created_at', '-post_id')
+              .values_list('created_at', 'post_id')[cap:cap + 1].first())
+    if cutoff is None:
+        return 0
+    created_at, post_id = cutoff
+    deleted, _ = TimelineEntry.objects.filter(
+        Q(created_at__lt=created_at) |
+        Q(created_at=created_at, post_id__lte=post_id),
+        user_id=user_id).delete()
+    return deleted
+
+
+def rebuild(user):
+    """Recreate a user's timeline from the accounts they follow."""
+    TimelineEntry.objects.filter(user=user).delete()
+    posts = (Post.objects
+             .filter(author__followers__follower=user,
+                     author__followers_count__lte=fanout_limit())
+             .order_by('-created_at', '-id')[:max_entries()])
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=user, post=post, author_id=post.author_id,
+                       created_at=post.created_at) for post in posts],
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def feed_sources(user):
+    """
+    Querysets whose union is ``user``'s home feed, each exposing the
+    ``(created_at, post_id)`` columns the feed is paginated on.
+    """
+    if follow_graph.enabled:
+        following = follow_graph.following_ids(user.pk)
+        pulled = list(User.objects.filter(
+            pk__in=following, followers_count__gt=fanout_limit(),
+        ).values_list('pk', flat=True)) if following else []
+    else:
+        pulled = list(Follow.objects.filter(
+            follower=user, following__followers_count__gt=fanout_limit(),
+        ).values_list('following_id', flat=True))
+    entries = TimelineEntry.objects.filter(user=user)
+    if not pulled:
+        return [entries]
+    # Entries fanned out before an author crossed the limit are skipped so
+    # the merged stream does not contain duplicates.
+    return [
+        entries.exclude(author_id__in=pulled),
+        Post.objects.filter(author_id__in=pulled).annotate(post_id=F('id')),
+    ]
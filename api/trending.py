@@ -0,0 +1,100 @@
+"""
+Time-decayed trending scores for posts.
+
+A post's trending score is the decayed sum of its engagement: each event of
+weight ``w`` at time ``t`` is worth ``w * exp(-(now - t) / TAU)``. Because
+every term decays at the same rate, ordering by that sum is the same as
+ordering by ``sum(w * exp((t - EPOCH) / TAU))``, which never changes once an
+event is counted. ``Post.trending_score`` stores the natural log of the
+latter, so:
+
+* a new event is folded in with one ``UPDATE`` (``log(e^s + e^x)``) and no
+  decay has to be applied to anything else;
+* the values grow by one every ``TAU`` instead of exponentially, so they
+  never overflow;
+* reads are an index scan over ``(-trending_score, -id)``.
+
+Removing a like or bookmark does not lower the score right away;
+``manage.py rescore_trending`` recomputes recently active posts from their
+rows and also corrects anything the incremental updates approximated.
+"""
+import datetime
+import math
+from collections import defaultdict
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+
+from .models import Bookmark, Comment, Like, Post
+
+ORDERING = ('-trending_score', '-id')
+
+HALF_LIFE = datetime.timedelta(hours=12)
+TAU = HALF_LIFE.total_seconds() / math.log(2)
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+# Publishing a post counts as an event too, so new posts can trend
+WEIGHTS = {
+    Post: 1.0,
+    Like: 1.0,
+    Bookmark: 2.0,
+    Comment: 3.0,
+}
+
+
+def event_score(model, moment=None, count=1):
+    """The log-space score of ``count`` ``model`` events at ``moment``."""
+    moment = moment or timezone.now()
+    return (math.log(WEIGHTS[model] * count)
+            + (moment - EPOCH).total_seconds() / TAU)
+
+
+def combine(scores):
+    """``log(sum(exp(score)))`` of several log-space scores."""
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def bumped(model, count=1):
+    """An update expression folding ``count`` new ``model`` events into the score."""
+    current = F('trending_score')
+    added = Value(event_score(model, count=count), output_field=FloatField())
+    return Greatest(current, added) + Ln(1 + Exp(-Abs(current - added)))
+
+
+def bump(model, post_ids):
+    """
+    Fold one new ``model`` event per entry of ``post_ids`` into those posts'
+    scores; a post listed several times gets several events.
+    """
+    counts = defaultdict(int)
+    for post_id in post_ids:
+        counts[post_id] += 1
+    by_count = defaultdict(list)
+    for post_id, count in counts.items():
+        by_count[count].append(post_id)
+    for count, ids in by_count.items():
+        Post.objects.filter(pk__in=ids).update(
+            trending_score=bumped(model, count))
+
+
+def rescore(post_ids):
+    """Recompute the scores of ``post_ids`` from their rows; returns the posts."""
+    scores = defaultdict(list)
+    posts = list(Post.objects.filter(pk__in=post_ids).only('id', 'created_at'))
+    for post in posts:
+        scores[post.pk].append(event_score(Post, post.created_at))
+    for model in (Like, Bookmark, Comment):
+        rows = model.objects.filter(post_id__in=post_ids).values_list(
+            'post_id', 'created_at')
+        for post_id, created_at in rows.iterator():
+            scores[post_id].append(event_score(model, created_at))
+    for post in posts:
+        post.trending_score = combine(scores[post.pk])
+    Post.objects.bulk_update(posts, ['trending_score'], batch_size=500)
+    return posts
+
+
+def trending():
+    return Post.objects.with_author().order_by(*ORDERING)
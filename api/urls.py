@@ -15,9 +15,11 @@ urlpatterns = [
      path('auth/password-reset/', views.request_password_reset, name='request-password-reset'),
      path('auth/password-reset/confirm/', views.confirm_password_reset, name='confirm-password-reset'),
      path('users/me/', views.get_current_user, name='current-user'),
+     path('users/suggestions/', views.follow_suggestions, name='follow-suggestions'),
      path('users/<str:username>/follow/', views.follow_user, name='follow-user'),
      path('users/<str:username>/unfollow/',views.unfollow_user, name='unfollow-user'),
      path('users/<str:username>/activity/',views.get_user_activity, name='user-activity'),
+     path('users/<str:username>/mutuals/',views.get_user_mutuals, name='user-mutuals'),
      path('users/<str:username>/posts/',views.get_user_posts, name='user-posts'),
      path('feed/', views.feed, name='feed'),
      path('users/<str:username>/settings/',views.update_user_settings, name='update_user_settings'),
@@ -29,10 +31,12 @@ urlpatterns = [
      path('admin/stats/', admin_views.admin_stats, name='admin-stats'),
      path('admin/analytics/', admin_views.admin_analytics, name='admin-analytics'),
      path('admin/activity/', admin_views.admin_activity, name='admin-activity'),
+     path('admin/events/', admin_views.admin_events, name='admin-events'),
      path('admin/users/', admin_views.admin_users, name='admin-users'),
      path('admin/users/<int:user_id>/',admin_views.admin_users, name='admin-user-detail'),
      path('admin/users/<int:user_id>/role/',admin_views.update_user_role, name='admin-user-role'),
      path('admin/posts/', admin_views.admin_posts, name='admin-posts'),
      path('admin/comments/', admin_views.admin_comments, name='admin-comments'),
      path('admin/settings/', admin_views.admin_settings, name='admin-settings'),
+     path('admin/cache-stats/', admin_views.admin_cache_stats, name='admin-cache-stats'),
 ]
@@ -1,11 +1,16 @@
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from .models import Post, User, Like, Bookmark, Follow, Comment
-from .serializers import PostSerializer, UserSerializer, UserProfileSerializer, LikeSerializer, BookmarkSerializer, FollowSerializer, CommentSerializer
+from .serializers import PostSerializer, UserSerializer, UserProfileSerializer, LikeSerializer, BookmarkSerializer, FollowSerializer, CommentSerializer, EngagementBatchSerializer
+from .loaders import get_viewer_state
+from .pagination import KeysetPagination
+from . import (activity, avatars, conditional, engagement, events,
+               follow_graph, follows, search, suggestions, timeline, trending,
+               write_behind)
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import AllowAny
 from django.contrib.auth import get_user_model
@@ -23,8 +28,118 @@ class PostViewSet(viewsets.ModelViewSet):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def get_queryset(self):
+        return Post.objects.with_author()
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        validators = conditional.get_validators(
+            request, conditional.post_sources(page), collection=True)
+        response = conditional.not_modified(request, validators)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(page, many=True)
+        return conditional.add_validators(
+            self.get_paginated_response(serializer.data), validators)
+
+    def retrieve(self, request, *args, **kwargs):
+        post = self.get_object()
+        validators = conditional.get_validators(
+            request, conditional.post_sources([post]))
+        response = conditional.not_modified(request, validators)
+        if response is not None:
+            return response
+        return conditional.add_validators(
+            Response(self.get_serializer(post).data), validators)
+
+    @action(detail=False)
+    def search(self, request):
+        """Posts matching ``?q=`` in title or content, most relevant first."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'error': 'Query parameter q is required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination(ordering=search.ORDERING)
+        page = search.search_page(text, paginator, request)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def trending(self, request):
+        """Posts with the most recent engagement first (see api.trending)."""
+        paginator = KeysetPagination(ordering=trending.ORDERING)
+        page = paginator.paginate_queryset(trending.trending(), request)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='batch/like',
+            permission_classes=[permissions.IsAuthenticated])
+    def batch_like(self, request):
+        """Like (``add``) and unlike (``remove``) lists of posts at once."""
+        return self._batch_set_states(request, Like, 'is_liked', 'likes_count')
+
+    @action(detail=False, methods=['post'], url_path='batch/bookmark',
+            permission_classes=[permissions.IsAuthenticated])
+    def batch_bookmark(self, request):
+        """Bookmark (``add``) and unbookmark (``remove``) lists of posts."""
+        return self._batch_set_states(
+            request, Bookmark, 'is_bookmarked', 'bookmarks_count')
+
+    def _batch_set_states(self, request, model, flag, counter):
+        serializer = EngagementBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add = serializer.validated_data['add']
+        # Buffered single toggles must not overtake a later batch at flush
+        set_states = (write_behind.record_many if write_behind.enabled()
+                      else engagement.set_states)
+        counts = set_states(
+            model, request.user, add, serializer.validated_data['remove'])
+        add = set(add)
+        return Response({
+            'results': [{'id': post_id, flag: post_id in add, counter: count}
+                        for post_id, count in sorted(counts.items())],
+        })
+
+    @action(detail=False, url_path='batch/status')
+    def batch_status(self, request):
+        """
+        The viewer's like/bookmark state and the counters of up to
+        ``BATCH_MAX_POSTS`` posts given as ``?ids=1,2,3``.
+        """
+        try:
+            post_ids = {int(value) for value in
+                        request.query_params.get('ids', '').split(',') if value}
+        except ValueError:
+            return Response({'error': 'ids must be a comma-separated list of integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(post_ids) > engagement.BATCH_MAX_POSTS:
+            return Response(
+                {'error': f'At most {engagement.BATCH_MAX_POSTS} ids per request'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        rows = Post.objects.filter(pk__in=post_ids).order_by('pk').values_list(
+            'pk', 'likes_count', 'bookmarks_count')
+        state = get_viewer_state({'request': request})
+        if state is not None:
+            state.prime(liked=post_ids, bookmarked=post_ids)
+        return Response({
+            'results': [{
+                'id': post_id,
+                'is_liked': state is not None and state.is_liked(post_id),
+                'is_bookmarked': state is not None and state.is_bookmarked(post_id),
+                'likes_count': likes_count,
+                'bookmarks_count': bookmarks_count,
+            } for post_id, likes_count, bookmarks_count in rows],
+        })
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        engagement.create_post(serializer, self.request.user)
+
+    def perform_update(self, serializer):
+        engagement.update_post(serializer)
+
+    def perform_destroy(self, instance):
+        engagement.delete_post(instance)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -69,6 +184,7 @@ def login(request):
     user = authenticate(username=username, password=password)
 
     if user:
+        events.append(user, 'login')
         refresh = RefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
@@ -85,8 +201,12 @@ def user_profile(request, username):
     user = get_object_or_404(User, username=username)
 
     if request.method == 'GET':
-        serializer = UserSerializer(user)
-        return Response(serializer.data)
+        validators = conditional.get_validators(request, [('user', user.pk)])
+        response = conditional.not_modified(request, validators)
+        if response is not None:
+            return response
+        serializer = UserSerializer(user, context={'request': request})
+        return conditional.add_validators(Response(serializer.data), validators)
 
     elif request.method == 'PUT':
         if request.user.username != username:
@@ -110,40 +230,58 @@ def user_profile(request, username):
 @api_view(['GET'])
 def get_user_posts(request, username):
     user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
-    serializer = PostSerializer(posts, many=True, context={'request': request})
-    return Response(serializer.data)
+    posts = Post.objects.with_author().filter(author=user)
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(posts, request)
+    validators = conditional.get_validators(
+        request, [('user', user.pk)] + conditional.post_sources(page),
+        collection=True)
+    response = conditional.not_modified(request, validators)
+    if response is not None:
+        return response
+    serializer = PostSerializer(page, many=True, context={'request': request})
+    return conditional.add_validators(
+        paginator.get_paginated_response(serializer.data), validators)
 
 
 @api_view(['GET'])
 def get_user_activity(request, username):
+    """
+    The user's likes, comments and bookmarks, newest first, as one
+    keyset-paginated stream; ``?type=like,comment`` limits the kinds.
+    """
     user = get_object_or_404(User, username=username)
-    likes = Like.objects.filter(user=user)
-    comments = Comment.objects.filter(author=user)
-    bookmarks = Bookmark.objects.filter(user=user)
-    return Response({
-        'likes': LikeSerializer(likes, many=True).data,
-        'comments': CommentSerializer(comments, many=True).data,
-        'bookmarks': BookmarkSerializer(bookmarks, many=True).data,
-    })
+    try:
+        types = activity.parse_types(request.query_params.get('type'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    paginator = KeysetPagination(ordering=activity.ORDERING)
+    page = paginator.paginate_merged(activity.sources(user, types), request)
+    return paginator.get_paginated_response(
+        [activity.record(row) for row in page])
 
 
 @api_view(['POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
 def handle_like(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    posts = Post.objects.all()
+    set_state = engagement.set_state
+    if write_behind.enabled():
+        posts = write_behind.with_stored(posts, Like, request.user)
+        set_state = write_behind.record
+    post = get_object_or_404(posts, id=post_id)
     if request.method == 'POST':
-        Like.objects.get_or_create(user=request.user, post=post)
+        likes_count = set_state(Like, request.user, post, True)
         return Response({
             'status': 'liked',
-            'likes_count': post.post_likes.count(),
+            'likes_count': likes_count,
             'is_liked': True
         })
     elif request.method == 'DELETE':
-        Like.objects.filter(user=request.user, post=post).delete()
+        likes_count = set_state(Like, request.user, post, False)
         return Response({
             'status': 'unliked',
-            'likes_count': post.post_likes.count(),
+            'likes_count': likes_count,
             'is_liked': False
         })
 
@@ -151,19 +289,24 @@ def handle_like(request, post_id):
 @api_view(['POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
 def handle_bookmark(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    posts = Post.objects.all()
+    set_state = engagement.set_state
+    if write_behind.enabled():
+        posts = write_behind.with_stored(posts, Bookmark, request.user)
+        set_state = write_behind.record
+    post = get_object_or_404(posts, id=post_id)
     if request.method == 'POST':
-        Bookmark.objects.get_or_create(user=request.user, post=post)
+        bookmarks_count = set_state(Bookmark, request.user, post, True)
         return Response({
             'status': 'bookmarked',
-            'bookmarks_count': post.post_bookmarks.count(),
+            'bookmarks_count': bookmarks_count,
             'is_bookmarked': True
         })
     elif request.method == 'DELETE':
-        Bookmark.objects.filter(user=request.user, post=post).delete()
+        bookmarks_count = set_state(Bookmark, request.user, post, False)
         return Response({
             'status': 'unbookmarked',
-            'bookmarks_count': post.post_bookmarks.count(),
+            'bookmarks_count': bookmarks_count,
             'is_bookmarked': False
         })
 
@@ -173,13 +316,17 @@ def handle_bookmark(request, post_id):
 def handle_follow(request, username):
     user_to_follow = get_object_or_404(User, username=username)
     if request.method == 'POST':
-        Follow.objects.get_or_create(
-            follower=request.user, following=user_to_follow)
-        return Response({'status': 'following'})
+        follows.follow(request.user, user_to_follow)
+        return Response({
+            'status': 'following',
+            'followers_count': user_to_follow.followers_count,
+        })
     elif request.method == 'DELETE':
-        Follow.objects.filter(follower=request.user,
-                              following=user_to_follow).delete()
-        return Response({'status': 'unfollowed'})
+        follows.unfollow(request.user, user_to_follow)
+        return Response({
+            'status': 'unfollowed',
+            'followers_count': user_to_follow.followers_count,
+        })
 
 
 @api_view(['PUT'])
@@ -199,11 +346,21 @@ def update_profile_picture(request, username):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def feed(request):
-    following = Follow.objects.filter(
-        follower=request.user).values_list('following', flat=True)
-    posts = Post.objects.filter(author__in=following).order_by('-created_at')
-    serializer = PostSerializer(posts, many=True, context={'request': request})
-    return Response(serializer.data)
+    paginator = KeysetPagination(ordering=('-created_at', '-post_id'))
+    page = paginator.paginate_merged(
+        timeline.feed_sources(request.user), request)
+    validators = conditional.get_validators(
+        request, conditional.post_sources(page), collection=True)
+    response = conditional.not_modified(request, validators)
+    if response is not None:
+        return response
+    posts = Post.objects.with_author().in_bulk(
+        [row.post_id for row in page])
+    serializer = PostSerializer(
+        [posts[row.post_id] for row in page if row.post_id in posts],
+        many=True, context={'request': request})
+    return conditional.add_validators(
+        paginator.get_paginated_response(serializer.data), validators)
 
 
 @api_view(['POST'])
@@ -222,12 +379,17 @@ class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # Comment threads read oldest first
+    ordering = ('created_at', 'id')
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        engagement.create_comment(serializer, self.request.user)
+
+    def perform_destroy(self, instance):
+        engagement.delete_comment(instance)
 
     def get_queryset(self):
-        queryset = Comment.objects.all()
+        queryset = Comment.objects.with_author()
         post_id = self.request.query_params.get('post', None)
         if post_id is not None:
             queryset = queryset.filter(post_id=post_id)
@@ -275,17 +437,22 @@ def update_user_settings(request, username):
 @permission_classes([permissions.IsAuthenticated])
 def follow_user(request, username):
     user_to_follow = get_object_or_404(User, username=username)
-    Follow.objects.get_or_create(
-        follower=request.user, following=user_to_follow)
-    return Response({'status': 'following'})
+    follows.follow(request.user, user_to_follow)
+    return Response({
+        'status': 'following',
+        'followers_count': user_to_follow.followers_count,
+    })
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def unfollow_user(request, username):
     user_to_follow = get_object_or_404(User, username=username)
-    Follow.objects.filter(follower=request.user,following=user_to_follow).delete()
-    return Response({'status': 'unfollowed'})
+    follows.unfollow(request.user, user_to_follow)
+    return Response({
+        'status': 'unfollowed',
+        'followers_count': user_to_follow.followers_count,
+    })
 
 
 @api_view(['GET'])
@@ -296,6 +463,41 @@ def get_current_user(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticatedOrReadOnly])
+def get_user_mutuals(request, username):
+    """Accounts that follow ``username`` and that ``username`` follows back."""
+    user = get_object_or_404(User, username=username)
+    paginator = KeysetPagination(ordering=follow_graph.MUTUALS_ORDERING)
+    page = follow_graph.mutuals_page(user.pk, paginator, request)
+    serializer = UserSerializer(page, many=True, context={'request': request},
+                                fieldset=UserSerializer.CARD_FIELDS,
+                                avatar_size=avatars.CARD_SIZE)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def follow_suggestions(request):
+    """
+    Accounts followed by people the viewer follows, the most shared first
+    (``?limit=`` caps the list at ``FOLLOW_SUGGESTIONS_PER_USER``).
+    """
+    limit = request.query_params.get('limit')
+    if limit is not None and (not limit.isdigit() or int(limit) < 1):
+        return Response({'error': 'limit must be a positive integer'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    rows = list(suggestions.for_user(
+        request.user, int(limit) if limit else None))
+    cards = UserSerializer([row.candidate for row in rows], many=True,
+                           context={'request': request},
+                           fieldset=UserSerializer.CARD_FIELDS,
+                           avatar_size=avatars.CARD_SIZE).data
+    return Response({'results': [
+        {**card, 'followed_by_following': row.score}
+        for card, row in zip(cards, rows)]})
+
+
 @api_view(['GET'])
 @permission_classes([])  # No authentication required
 def health_check(request):
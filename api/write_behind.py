@@ -0,0 +1,314 @@
+"""
+Optional write-behind buffering of like/bookmark toggles.
+
+With ``ENGAGEMENT_WRITE_BEHIND['ENABLED']``, ``handle_like``,
+``handle_bookmark`` and the batch endpoints record the requested state in
+a buffer instead of writing it. Events are coalesced per ``(kind, user,
+post)`` so only the last state survives, and a background thread in each
+process flushes the buffer every ``FLUSH_INTERVAL`` seconds with one bulk
+insert, one delete and one counter recount per kind
+(``engagement.apply_states``), which also bumps the fragment versions of
+the touched posts. Recording a state reads and writes nothing else.
+
+The acting user reads their own writes: ``ViewerState`` overlays the
+user's pending states on what is in the database, the endpoint reports
+the counter as it will be once the event is flushed, and the user's
+pending states are part of their ETags (api.conditional).
+
+Two buffers are provided: ``MemoryBuffer`` (one process; tests and
+development) and ``CacheBuffer`` (the shared Django cache, so events from
+every worker are flushed by whichever worker gets there first).
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models import Exists, OuterRef
+from django.utils.module_loading import import_string
+
+from . import engagement
+from .models import Bookmark, Like, Post
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'BACKEND': 'api.write_behind.MemoryBuffer',
+    'CACHE_ALIAS': 'default',
+    'FLUSH_INTERVAL': 1.0,
+}
+
+MODELS = {'like': Like, 'bookmark': Bookmark}
+KINDS = {model: kind for kind, model in MODELS.items()}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'ENGAGEMENT_WRITE_BEHIND', {})}
+
+
+def enabled():
+    return config()['ENABLED']
+
+
+class MemoryBuffer:
+    """Pending states in this process only."""
+
+    def __init__(self, options):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._draining = False
+
+    def put(self, kind, user_id, post_id, active):
+        with self._lock:
+            self._pending[kind, user_id, post_id] = active
+
+    def pending(self, kind, user_id, post_ids):
+        """``{post_id: active}`` for this user's unflushed states."""
+        found = {}
+        with self._lock:
+            for post_id in post_ids:
+                key = (kind, user_id, post_id)
+                if key in self._pending:
+                    found[post_id] = self._pending[key]
+                elif key in self._flushing:
+                    found[post_id] = self._flushing[key]
+        return found
+
+    def drain(self):
+        """
+        Take every pending state; call ``done`` or ``abort`` after. Returns
+        None when another thread is already flushing.
+        """
+        with self._lock:
+            if self._draining:
+                return None
+            self._draining = True
+            self._flushing, self._pending = self._pending, {}
+            return dict(self._flushing)
+
+    def done(self):
+        with self._lock:
+            self._flushing = {}
+            self._draining = False
+
+    def abort(self):
+        with self._lock:
+            # Anything put since the drain is newer and wins
+            self._pending = {**self._flushing, **self._pending}
+            self._flushing = {}
+            self._draining = False
+
+
+class CacheBuffer:
+    """
+    Pending states in the shared Django cache.
+
+    Each ``put`` takes a sequence number with ``incr`` and stores the event
+    under it, plus the user's latest state for read-your-writes. A flush
+    takes a lock with ``add`` and processes the events up to the sequence
+    number seen by the previous flush, so a writer between its ``incr`` and
+    its ``set`` is never skipped; an event still missing by then belongs to
+    a writer that died and is dropped.
+    """
+    SEQ_KEY = 'wb:seq'
+    FLUSHED_KEY = 'wb:flushed'
+    HORIZON_KEY = 'wb:horizon'
+    LOCK_KEY = 'wb:lock'
+    EVENT_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, options):
+        self.cache = caches[options['CACHE_ALIAS']]
+        interval = options['FLUSH_INTERVAL']
+        # Long enough to outlive the flush that persists the state
+        self.state_timeout = max(60, interval * 10)
+        self.lock_timeout = max(30, interval * 5)
+        self._drained = None
+
+    @staticmethod
+    def event_key(seq):
+        return f'wb:event:{seq}'
+
+    @staticmethod
+    def state_key(kind, user_id, post_id):
+        return f'wb:state:{kind}:{user_id}:{post_id}'
+
+    def put(self, kind, user_id, post_id, active):
+        self.cache.add(self.SEQ_KEY, 0, timeout=None)
+        seq = self.cache.incr(self.SEQ_KEY)
+        self.cache.set(self.event_key(seq), (kind, user_id, post_id, active),
+                       timeout=self.EVENT_TIMEOUT)
+        self.cache.set(self.state_key(kind, user_id, post_id), active,
+                       timeout=self.state_timeout)
+
+    def pending(self, kind, user_id, post_ids):
+        keys = {self.state_key(kind, user_id, post_id): post_id
+                for post_id in post_ids}
+        return {keys[key]: active
+                for key, active in self.cache.get_many(list(keys)).items()}
+
+    def drain(self):
+        if not self.cache.add(self.LOCK_KEY, 1, timeout=self.lock_timeout):
+            return None  # another worker is flushing
+        flushed = self.cache.get(self.FLUSHED_KEY, 0)
+        horizon = self.cache.get(self.HORIZON_KEY, 0)
+        current = self.cache.get(self.SEQ_KEY, 0)
+        keys = [self.event_key(seq) for seq in range(flushed + 1, horizon + 1)]
+
+        events = {}
+        found = {}
+        for start in range(0, len(keys), 1000):
+            found.update(self.cache.get_many(keys[start:start + 1000]))
+        for key in keys:
+            if key in found:
+                kind, user_id, post_id, active = found[key]
+                events[kind, user_id, post_id] = active
+        self._drained = (max(flushed, horizon), current, keys)
+        return events
+
+    def done(self):
+        flushed, current, keys = self._drained
+        self.cache.set_many({self.FLUSHED_KEY: flushed,
+                             self.HORIZON_KEY: current}, timeout=None)
+        self.cache.delete_many(keys)
+        self.cache.delete(self.LOCK_KEY)
+        self._drained = None
+
+    def abort(self):
+        self.cache.delete(self.LOCK_KEY)
+        self._drained = None
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = config()
+                _buffer = import_string(options['BACKEND'])(options)
+    return _buffer
+
+
+def flush():
+    """Persist everything buffered; returns the number of states written."""
+    buffer = get_buffer()
+    events = buffer.drain()
+    if events is None:
+        return 0
+    try:
+        for kind, model in MODELS.items():
+            states = {(user_id, post_id): active
+                      for (event_kind, user_id, post_id), active in events.items()
+                      if event_kind == kind}
+            if states:
+                engagement.apply_states(model, states)
+    except Exception:
+        buffer.abort()
+        raise
+    buffer.done()
+    return len(events)
+
+
+class Flusher(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name='engagement-write-behind', daemon=True)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                flush()
+            except Exception:
+                logger.exception('Flushing buffered engagement failed')
+            finally:
+                close_old_connections()
+
+
+_flusher = None
+_exit_flush_registered = False
+
+
+def ensure_flusher():
+    """Start this process's flusher thread if it is not running."""
+    global _flusher, _exit_flush_registered
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _buffer_lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = Flusher(config()['FLUSH_INTERVAL'])
+            _flusher.start()
+        if not _exit_flush_registered:
+            # Once per process, however often the thread is restarted
+            atexit.register(flush)
+            _exit_flush_registered = True
+
+
+def with_stored(posts, model, user):
+    """
+    ``posts`` annotated with ``stored``: whether ``user``'s ``model`` row
+    is in the database, which ``record`` needs to report the counter.
+    """
+    return posts.annotate(stored=Exists(
+        model.objects.filter(user=user, post=OuterRef('pk'))))
+
+
+def record(model, user, post, active):
+    """
+    Buffer ``user``'s ``model`` state on ``post`` (loaded through
+    ``with_stored``) and return the post's counter as it will be once
+    flushed.
+    """
+    ensure_flusher()
+    get_buffer().put(KINDS[model], user.pk, post.pk, active)
+    # The stored counter matches the stored rows, whatever is still pending
+    return max(getattr(post, engagement.COUNTER_FIELDS[model])
+               + int(active) - int(post.stored), 0)
+
+
+def record_many(model, user, add=(), remove=()):
+    """
+    Buffer ``user``'s ``model`` states on the posts in ``add`` and
+    ``remove``, like ``engagement.set_states``, so they are ordered with
+    the single toggles still pending. Returns ``{post_id: counter}`` as the
+    counters will be once flushed; unknown IDs are left out.
+    """
+    field = engagement.COUNTER_FIELDS[model]
+    states = {**{post_id: False for post_id in remove},
+              **{post_id: True for post_id in add}}
+    rows = with_stored(Post.objects.filter(pk__in=states), model, user).values_list(
+        'pk', field, 'stored')
+    ensure_flusher()
+    buffer = get_buffer()
+    counts = {}
+    for post_id, count, stored in rows:
+        buffer.put(KINDS[model], user.pk, post_id, states[post_id])
+        counts[post_id] = max(count + int(states[post_id]) - int(stored), 0)
+    return counts
+
+
+def pending_states(user_id, post_ids):
+    """
+    ``user_id``'s unflushed states on ``post_ids`` as sorted ``(kind,
+    post_id, active)``, for validators of responses that show them.
+    """
+    if not enabled() or not post_ids:
+        return []
+    buffer = get_buffer()
+    return sorted((kind, post_id, active) for kind in MODELS
+                  for post_id, active in buffer.pending(kind, user_id, post_ids).items())
+
+
+def pending(model, user_id, post_ids):
+    """``{post_id: active}`` for ``user_id``'s unflushed ``model`` states."""
+    if not enabled() or model not in KINDS or not post_ids:
+        return {}
+    return get_buffer().pending(KINDS[model], user_id, post_ids)
@@ -128,6 +128,50 @@ DATABASES = {
 }
 
 
+# Cache
+# Set REDIS_URL so every worker shares the same cache (and fragment versions)
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+# Serialized post/user fragments; needs a shared cache to be safe with
+# more than one worker, so it is only on by default when REDIS_URL is set.
+FRAGMENT_CACHE = {
+    'ENABLED': os.getenv('FRAGMENT_CACHE_ENABLED', str(bool(REDIS_URL))) == 'True',
+    'CACHE_ALIAS': 'default',
+    'LOCAL_MAX_ENTRIES': int(os.getenv('FRAGMENT_CACHE_LOCAL_ENTRIES', 2048)),
+    'TIMEOUT': 60 * 60,
+}
+
+# In-process LRU of each user's following/follower IDs (see api.follow_graph),
+# validated against shared versions like the fragment cache.
+FOLLOW_GRAPH_CACHE = {
+    'ENABLED': os.getenv('FOLLOW_GRAPH_CACHE_ENABLED', str(bool(REDIS_URL))) == 'True',
+    'MAX_BYTES': int(os.getenv('FOLLOW_GRAPH_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+}
+
+# ETag / Last-Modified validation of post, profile and feed responses; like
+# the fragment cache it relies on versions shared between workers.
+CONDITIONAL_GET_ENABLED = os.getenv(
+    'CONDITIONAL_GET_ENABLED', str(bool(REDIS_URL))) == 'True'
+
+# Buffer like/bookmark toggles and persist them in bulk every FLUSH_INTERVAL
+# seconds (see api.write_behind); the cache backend shares the buffer
+# between workers.
+ENGAGEMENT_WRITE_BEHIND = {
+    'ENABLED': os.getenv('ENGAGEMENT_WRITE_BEHIND', 'False') == 'True',
+    'BACKEND': ('api.write_behind.CacheBuffer' if REDIS_URL
+                else 'api.write_behind.MemoryBuffer'),
+    'CACHE_ALIAS': 'default',
+    'FLUSH_INTERVAL': float(os.getenv('ENGAGEMENT_FLUSH_INTERVAL', 1.0)),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -213,6 +257,8 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 20)),
 }
 
 # JWT Settings
@@ -244,6 +290,23 @@ SIMPLE_JWT = {
     'JTI_CLAIM': 'jti',
 }
 
+# Home timeline: posts are fanned out to followers' timelines on write,
+# except for authors with more followers than the limit, whose posts are
+# merged in when the feed is read.
+TIMELINE_MAX_ENTRIES = int(os.getenv('TIMELINE_MAX_ENTRIES', 800))
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('TIMELINE_FANOUT_MAX_FOLLOWERS', 5000))
+# Fan-out trims each recipient's timeline back to the cap with probability
+# 1/TIMELINE_TRIM_EVERY, so timelines overshoot it by about that many entries
+TIMELINE_TRIM_EVERY = int(os.getenv('TIMELINE_TRIM_EVERY', 50))
+
+# Who-to-follow suggestions: rebuilt by `manage.py rebuild_follow_suggestions`
+# and adjusted on every follow, except that follows of accounts with more
+# followers than the limit only reach those followers on the next rebuild.
+FOLLOW_SUGGESTIONS_PER_USER = int(os.getenv('FOLLOW_SUGGESTIONS_PER_USER', 50))
+FOLLOW_SUGGESTIONS_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FOLLOW_SUGGESTIONS_FANOUT_MAX_FOLLOWERS', 5000))
+
 # Email settings
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -283,6 +346,14 @@ SOCKETIO = {
     'PING_INTERVAL': 25,
 }
 
+# Chunked chat attachment uploads (communications.uploads). Partial files
+# live in TEMP_DIR, which must be shared by every web worker.
+CHAT_UPLOADS = {
+    'TEMP_DIR': os.getenv('CHAT_UPLOADS_TEMP_DIR', os.path.join(BASE_DIR, 'chat_uploads')),
+    'MAX_CHUNK_BYTES': int(os.getenv('CHAT_UPLOADS_MAX_CHUNK_BYTES', 1024 * 1024)),
+    'EXPIRE_AFTER_HOURS': int(os.getenv('CHAT_UPLOADS_EXPIRE_AFTER_HOURS', 24)),
+}
+
 # WebRTC Configuration
 WEBRTC_CONFIG = {
     'iceServers': [
@@ -19,12 +19,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from api import blobs
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/chat/', include('communications.urls')),
     path('api/', include('api.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 # Serve media files in development
 if settings.DEBUG:
+    urlpatterns.insert(0, path(
+        f'{settings.MEDIA_URL.strip("/")}/{blobs.PREFIX}/<path:path>', blobs.serve))
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
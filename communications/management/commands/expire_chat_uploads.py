@@ -0,0 +1,23 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from communications import uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked chat uploads that were abandoned before completing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=None,
+            help="Idle time before an upload expires (default: CHAT_UPLOADS['EXPIRE_AFTER_HOURS'])")
+
+    def handle(self, *args, **options):
+        idle = None
+        if options['hours'] is not None:
+            if options['hours'] < 0:
+                raise CommandError('--hours must not be negative')
+            idle = datetime.timedelta(hours=options['hours'])
+        expired = uploads.expire(idle)
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} chat uploads'))
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+from api.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('communications', '0003_message_file_name_message_file_size_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='call',
+            index=models.Index(fields=['chat_room', '-started_at'], name='call_room_started_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(fields=['chat_room', 'created_at'], name='message_room_created_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 01:34
+
+import api.blobs
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_blob'),
+        ('communications', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=api.blobs.content_storage, upload_to='chat_attachments/%Y/%m/%d/'),
+        ),
+    ]
@@ -1,6 +1,12 @@
+import uuid
+
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
 
+from api.blobs import content_storage
+
 class ChatRoom(models.Model):
     name = models.CharField(max_length=255, blank=True, null=True)
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_rooms')
@@ -29,7 +35,8 @@ class Message(models.Model):
     chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField()
-    attachment = models.FileField(upload_to='chat_attachments/%Y/%m/%d/', null=True, blank=True)
+    attachment = models.FileField(upload_to='chat_attachments/%Y/%m/%d/',
+                                  storage=content_storage, null=True, blank=True)
     file_name = models.CharField(max_length=255, null=True, blank=True)
     file_size = models.IntegerField(null=True, blank=True)  # Size in bytes
     file_type = models.CharField(max_length=100, null=True, blank=True)  # MIME type
@@ -39,6 +46,10 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['chat_room', 'created_at'],
+                         name='message_room_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.email} - {self.message_type} - {self.created_at}"
@@ -48,6 +59,42 @@ class Message(models.Model):
             return self.attachment.url
         return None
 
+
+@receiver(post_delete, sender=Message)
+def release_attachment(sender, instance, **kwargs):
+    if instance.attachment:
+        instance.attachment.storage.delete(instance.attachment.name)
+
+class ChatUpload(models.Model):
+    """
+    An attachment being uploaded in chunks (communications.uploads); the
+    message that sends it references the upload by ID once it is complete.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                             related_name='chat_uploads')
+    chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='uploads')
+    message_type = models.CharField(max_length=10, choices=Message.MESSAGE_TYPES)
+    file_name = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=100)  # Declared MIME type, checked against the bytes
+    file_size = models.IntegerField()  # Declared size in bytes
+    # Bytes received so far; the next chunk must start here
+    offset = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='chat_upload_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.offset}/{self.file_size} bytes)"
+
+    @property
+    def complete(self):
+        return self.offset == self.file_size
+
 class Call(models.Model):
     CALL_STATUS = (
         ('ringing', 'Ringing'),
@@ -70,5 +117,11 @@ class Call(models.Model):
     ended_at = models.DateTimeField(null=True, blank=True)
     duration = models.DurationField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat_room', '-started_at'],
+                         name='call_room_started_idx'),
+        ]
+
     def __str__(self):
         return f"{self.call_type} call from {self.initiator.email} to {self.receiver.email}"
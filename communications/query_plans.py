@@ -0,0 +1,26 @@
+"""
+The hot access paths of the communications app; see api.query_plans.
+"""
+from api.query_plans import QueryPlan
+
+import datetime
+
+from django.utils import timezone
+
+from .models import Call, ChatUpload, Message
+
+PLANS = [
+    QueryPlan(
+        'chat history',
+        lambda: Message.objects.filter(chat_room_id=1).order_by('created_at')[:50],
+        Message, ['chat_room_id', 'created_at']),
+    QueryPlan(
+        'call history',
+        lambda: Call.objects.filter(chat_room_id=1).order_by('-started_at')[:50],
+        Call, ['chat_room_id', 'started_at']),
+    QueryPlan(
+        'expired chat uploads',
+        lambda: ChatUpload.objects.filter(
+            updated_at__lt=timezone.now() - datetime.timedelta(hours=24)),
+        ChatUpload, ['updated_at']),
+]
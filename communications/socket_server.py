@@ -1,25 +1,17 @@
 import socketio
 import jwt
-import base64
 import os
 import mimetypes
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from .models import ChatRoom, Message, Call
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
 from django.utils import timezone
+from . import uploads
 from .utils import get_turn_credentials
 
 User = get_user_model()
 
-# File upload settings
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-ALLOWED_FILE_TYPES = {
-    'image': ['image/jpeg', 'image/png', 'image/gif'],
-    'file': ['application/pdf', 'text/plain', 'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'],
-    'voice': ['audio/wav', 'audio/mpeg', 'audio/webm']
-}
-
 # Create a Socket.io server
 sio = socketio.AsyncServer(
     async_mode='aiohttp',
@@ -102,56 +94,25 @@ async def send_message(sid, data):
         room = await ChatRoom.objects.aget(id=room_id, participants__id=user_id)
         user = await User.objects.aget(id=user_id)
         
-        message_data = {
-            'chat_room': room,
-            'sender': user,
-            'content': content,
-            'message_type': message_type
-        }
-
-        # Handle file attachments
+        # Attachments are uploaded in chunks over HTTP first
+        # (communications.uploads); the event only names the finished upload
         if message_type in ['file', 'image', 'voice']:
-            file_data = data.get('file')
-            if not file_data:
-                return {'status': 'error', 'message': 'No file data provided'}
-            
-            # Check file type
-            file_type = file_data.get('type', '')
-            if not file_type or file_type not in ALLOWED_FILE_TYPES.get(message_type, []):
-                return {
-                    'status': 'error', 
-                    'message': f'Unsupported file type. Allowed types for {message_type}: {", ".join(ALLOWED_FILE_TYPES[message_type])}'
-                }
-            
-            # Decode base64 file data
+            upload_id = data.get('upload_id')
+            if not upload_id:
+                return {'status': 'error', 'message': 'No upload_id provided'}
             try:
-                file_content = base64.b64decode(file_data['data'])
-                file_size = len(file_content)
-                
-                # Check file size
-                if file_size > MAX_FILE_SIZE:
-                    return {
-                        'status': 'error',
-                        'message': f'File too large. Maximum size allowed: {MAX_FILE_SIZE/1024/1024}MB'
-                    }
-                
-                file_name = file_data['name']
-                
-                # Create file from decoded data
-                file_content = ContentFile(file_content, name=file_name)
-                
-                # Add file data to message
-                message_data.update({
-                    'attachment': file_content,
-                    'file_name': file_name,
-                    'file_type': file_type,
-                    'file_size': file_size
-                })
-            except Exception as e:
-                print(f"File processing error: {str(e)}")
-                return {'status': 'error', 'message': 'Failed to process file'}
-        
-        message = await Message.objects.acreate(**message_data)
+                # Copying the file into storage must not block the event loop
+                message = await sync_to_async(uploads.create_message)(
+                    upload_id, user, room, content)
+            except uploads.UploadError as e:
+                return {'status': 'error', 'message': str(e)}
+        else:
+            message = await Message.objects.acreate(
+                chat_room=room,
+                sender=user,
+                content=content,
+                message_type=message_type
+            )
         
         # Prepare broadcast data
         broadcast_data = {
@@ -159,7 +120,7 @@ async def send_message(sid, data):
             'room_id': room_id,
             'sender': user.email,
             'content': content,
-            'type': message_type,
+            'type': message.message_type,
             'timestamp': message.created_at.isoformat()
         }
         
@@ -1,3 +1,83 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.models import User
+from . import uploads
+from .models import ChatRoom, ChatUpload, Message
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings = override_settings(
+            MEDIA_ROOT=root, CHAT_UPLOADS={'TEMP_DIR': root, 'MAX_CHUNK_BYTES': 8})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user(
+            username='sender', email='sender@example.com', password='pw')
+        self.room = ChatRoom.objects.create()
+        self.room.participants.add(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, file_type='text/plain', file_size=10, message_type='file'):
+        response = self.client.post('/api/chat/uploads/', {
+            'room_id': self.room.pk, 'type': message_type, 'file_name': 'notes.txt',
+            'file_type': file_type, 'file_size': file_size}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response['Location']
+
+    def patch(self, url, offset, data):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_chunks_are_appended_at_the_offset(self):
+        url = self.start()
+        response = self.patch(url, 0, b'hello')
+        self.assertEqual((response.status_code, response['Upload-Offset']), (200, '5'))
+        response = self.patch(url, 5, b'world')
+        self.assertTrue(response.data['complete'])
+
+        upload_id = response.data['upload_id']
+        message = uploads.create_message(upload_id, self.user, self.room)
+        with message.attachment.open('rb') as attachment:
+            self.assertEqual(attachment.read(), b'helloworld')
+        self.assertFalse(ChatUpload.objects.filter(pk=upload_id).exists())
+
+    def test_wrong_offset_conflicts_with_the_offset_to_resume_from(self):
+        url = self.start()
+        self.patch(url, 0, b'hello')
+        response = self.patch(url, 0, b'hello')
+        self.assertEqual((response.status_code, response.data['offset']), (409, 5))
+        self.assertEqual(self.client.get(url).data['offset'], 5)
+
+    def test_chunks_past_the_declared_size_are_too_large(self):
+        url = self.start(file_size=6)
+        self.patch(url, 0, b'hello')
+        response = self.patch(url, 5, b'world')
+        self.assertEqual((response.status_code, response.data['offset']), (413, 5))
+
+    def test_chunks_over_the_chunk_limit_are_too_large(self):
+        url = self.start()
+        response = self.patch(url, 0, b'helloworld')
+        self.assertEqual((response.status_code, response.data['offset']), (413, 0))
+
+    def test_content_not_matching_the_type_discards_the_upload(self):
+        url = self.start(file_type='image/png', file_size=8, message_type='image')
+        response = self.patch(url, 0, b'GIF89a..')
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_incomplete_uploads_cannot_be_sent(self):
+        url = self.start()
+        upload_id = self.patch(url, 0, b'hello').data['upload_id']
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.create_message(upload_id, self.user, self.room)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertFalse(Message.objects.exists())
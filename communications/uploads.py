@@ -0,0 +1,226 @@
+"""
+Chunked, resumable chat attachment uploads.
+
+A client announces an attachment (``POST /api/chat/uploads/``) with its
+room, name, MIME type and size, then sends the bytes as raw ``PATCH``
+bodies carrying an ``Upload-Offset`` header. Each chunk is streamed to a
+temporary file in ``CHAT_UPLOADS['TEMP_DIR']`` and checked while it is
+written: it may not run past the declared size, the first bytes must match
+the declared MIME type and text files may not contain NUL bytes. A chunk
+sent at the wrong offset gets a 409 with the offset to resume from (also
+returned by ``GET``), so an interrupted upload continues where it stopped.
+
+Once complete, the ``send_message`` Socket.IO event references the upload
+by ID instead of carrying the file; ``create_message`` turns it into the
+message's attachment (api.blobs) and removes the temporary file. Uploads
+idle longer than ``EXPIRE_AFTER_HOURS`` are deleted by
+``manage.py expire_chat_uploads``.
+"""
+import datetime
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChatUpload, Message
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+ALLOWED_FILE_TYPES = {
+    'image': ['image/jpeg', 'image/png', 'image/gif'],
+    'file': ['application/pdf', 'text/plain', 'application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'],
+    'voice': ['audio/wav', 'audio/mpeg', 'audio/webm']
+}
+
+# MIME type -> accepted (offset, bytes) prefixes; all of a tuple must match
+SIGNATURES = {
+    'image/jpeg': [((0, b'\xff\xd8\xff'),)],
+    'image/png': [((0, b'\x89PNG\r\n\x1a\n'),)],
+    'image/gif': [((0, b'GIF87a'),), ((0, b'GIF89a'),)],
+    'application/pdf': [((0, b'%PDF-'),)],
+    'application/msword': [((0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'),)],
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+        [((0, b'PK\x03\x04'),)],
+    'audio/wav': [((0, b'RIFF'), (8, b'WAVE'))],
+    'audio/mpeg': [((0, b'ID3'),), ((0, b'\xff\xfb'),), ((0, b'\xff\xf3'),),
+                   ((0, b'\xff\xf2'),)],
+    'audio/webm': [((0, b'\x1a\x45\xdf\xa3'),)],
+}
+# Enough of the file to check any signature above
+SNIFF_BYTES = 12
+READ_SIZE = 64 * 1024
+
+DEFAULTS = {
+    'TEMP_DIR': os.path.join(settings.BASE_DIR, 'chat_uploads'),
+    'MAX_CHUNK_BYTES': 1024 * 1024,
+    'EXPIRE_AFTER_HOURS': 24,
+}
+
+
+class UploadError(Exception):
+    """A rejected upload or chunk; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'CHAT_UPLOADS', {})}
+
+
+def temp_path(upload):
+    return os.path.join(config()['TEMP_DIR'], f'{upload.pk}.part')
+
+
+def check_type(message_type, file_type):
+    allowed = ALLOWED_FILE_TYPES.get(message_type)
+    if allowed is None:
+        raise UploadError(f'Unsupported message type: {message_type}')
+    if file_type not in allowed:
+        raise UploadError(
+            f'Unsupported file type. Allowed types for {message_type}: {", ".join(allowed)}',
+            status=415)
+
+
+def matches_type(head, file_type):
+    """Whether the first bytes of a file fit its declared MIME type."""
+    signatures = SIGNATURES.get(file_type)
+    if signatures is None:
+        return True
+    return any(all(head[offset:offset + len(magic)] == magic for offset, magic in signature)
+               for signature in signatures)
+
+
+def start(user, room, message_type, file_name, file_type, file_size):
+    """Validate an announced attachment and create its upload."""
+    check_type(message_type, file_type)
+    if file_size <= 0:
+        raise UploadError('file_size must be positive')
+    if file_size > MAX_FILE_SIZE:
+        raise UploadError(
+            f'File too large. Maximum size allowed: {MAX_FILE_SIZE/1024/1024}MB', status=413)
+    upload = ChatUpload.objects.create(
+        user=user, chat_room=room, message_type=message_type,
+        file_name=os.path.basename(file_name)[:255], file_type=file_type,
+        file_size=file_size)
+    os.makedirs(config()['TEMP_DIR'], exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def append(upload_id, user, offset, stream, length=None):
+    """
+    Write the chunk read from ``stream`` at ``offset``, checking it as it
+    arrives. Returns the upload with its new offset.
+    """
+    max_chunk = config()['MAX_CHUNK_BYTES']
+    if length is not None and length > max_chunk:
+        raise UploadError(f'Chunks may be at most {max_chunk} bytes', status=413)
+
+    try:
+        with transaction.atomic():
+            # Serializes chunks of one upload; the offset is re-checked under the lock
+            upload = ChatUpload.objects.select_for_update().filter(
+                pk=upload_id, user=user).first()
+            if upload is None:
+                raise UploadError('Upload not found', status=404)
+            if offset != upload.offset:
+                raise UploadError('Offset mismatch', status=409)
+            upload.offset += _write(upload, stream, max_chunk)
+            upload.save(update_fields=['offset', 'updated_at'])
+    except UploadError as error:
+        if error.status == 415:
+            # The declared type was wrong; nothing sent later can fix it
+            for rejected in ChatUpload.objects.filter(pk=upload_id):
+                discard(rejected)
+        raise
+    return upload
+
+
+def _write(upload, stream, max_chunk):
+    """Stream a chunk into the temporary file at the upload's offset; returns its length."""
+    remaining = upload.file_size - upload.offset
+    written = 0
+    try:
+        with open(temp_path(upload), 'r+b') as part:
+            part.seek(upload.offset)
+            while True:
+                data = stream.read(min(READ_SIZE, max_chunk - written + 1))
+                if not data:
+                    break
+                written += len(data)
+                if written > max_chunk:
+                    raise UploadError(f'Chunks may be at most {max_chunk} bytes', status=413)
+                if written > remaining:
+                    raise UploadError('Chunk runs past the declared file size', status=413)
+                if upload.file_type == 'text/plain' and b'\0' in data:
+                    raise UploadError('Text files may not contain binary data', status=415)
+                part.write(data)
+            # Drops whatever a chunk that failed half-way left behind
+            part.truncate()
+            end = upload.offset + written
+            if upload.offset < SNIFF_BYTES and end >= min(SNIFF_BYTES, upload.file_size):
+                part.seek(0)
+                if not matches_type(part.read(SNIFF_BYTES), upload.file_type):
+                    raise UploadError(f'File content is not {upload.file_type}', status=415)
+    except FileNotFoundError:
+        raise UploadError('Upload expired', status=404)
+    return written
+
+
+def discard(upload):
+    """Delete an upload and, once that commits, its temporary file."""
+    path = temp_path(upload)
+    upload.delete()
+    transaction.on_commit(lambda: _remove(path))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def create_message(upload_id, user, room, content=''):
+    """
+    Create the message sending a complete upload in ``room`` and consume
+    the upload. Runs synchronously: call it through ``sync_to_async`` from
+    the event loop.
+    """
+    with transaction.atomic():
+        try:
+            upload = ChatUpload.objects.select_for_update().filter(
+                pk=upload_id, user=user, chat_room=room).first()
+        except ValidationError:  # Not a UUID
+            upload = None
+        if upload is None:
+            raise UploadError('Upload not found', status=404)
+        if not upload.complete:
+            raise UploadError(
+                f'Upload incomplete: {upload.offset} of {upload.file_size} bytes received', status=409)
+        with open(temp_path(upload), 'rb') as part:
+            message = Message.objects.create(
+                chat_room=room, sender=user, content=content,
+                message_type=upload.message_type,
+                attachment=File(part, name=upload.file_name),
+                file_name=upload.file_name, file_type=upload.file_type,
+                file_size=upload.file_size)
+        discard(upload)
+    return message
+
+
+def expire(idle=None):
+    """Delete uploads idle longer than ``idle``; returns how many."""
+    if idle is None:
+        idle = datetime.timedelta(hours=config()['EXPIRE_AFTER_HOURS'])
+    expired = 0
+    stale = ChatUpload.objects.filter(updated_at__lt=timezone.now() - idle)
+    for upload in stale.iterator():
+        with transaction.atomic():
+            discard(upload)
+        expired += 1
+    return expired
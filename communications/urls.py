@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('uploads/', views.create_upload, name='chat-upload-create'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='chat-upload-detail'),
+]
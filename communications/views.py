@@ -1,3 +1,95 @@
-from django.shortcuts import render
+import io
 
-# Create your views here.
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import ChatRoom, ChatUpload
+from . import uploads
+
+
+def upload_state(upload):
+    return {
+        'upload_id': str(upload.pk),
+        'offset': upload.offset,
+        'file_size': upload.file_size,
+        'complete': upload.complete,
+    }
+
+
+def header_int(request, name):
+    """A non-negative integer header, or None if it is missing or malformed."""
+    value = request.headers.get(name, '')
+    return int(value) if value.isascii() and value.isdigit() else None
+
+
+def upload_response(upload, status=status.HTTP_200_OK):
+    response = Response(upload_state(upload), status=status)
+    response['Upload-Offset'] = str(upload.offset)
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload(request):
+    """Announce a chat attachment; its bytes follow as PATCH chunks"""
+    try:
+        file_size = int(request.data.get('file_size'))
+    except (TypeError, ValueError):
+        return Response({'error': 'file_size must be an integer'}, status=400)
+    room = ChatRoom.objects.filter(
+        id=request.data.get('room_id'), participants=request.user).first()
+    if room is None:
+        return Response({'error': 'Room not found or access denied'}, status=404)
+    try:
+        upload = uploads.start(
+            request.user, room,
+            message_type=request.data.get('type', 'file'),
+            file_name=request.data.get('file_name') or 'attachment',
+            file_type=request.data.get('file_type', ''),
+            file_size=file_size)
+    except uploads.UploadError as error:
+        return Response({'error': str(error)}, status=error.status)
+    response = upload_response(upload, status=status.HTTP_201_CREATED)
+    response['Location'] = f'{request.path.rstrip("/")}/{upload.pk}/'
+    return response
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, upload_id):
+    """
+    GET: the offset to resume from. PATCH: append the raw request body at
+    the ``Upload-Offset`` header. DELETE: abandon the upload.
+    """
+    if request.method == 'PATCH':
+        offset = header_int(request, 'Upload-Offset')
+        if offset is None:
+            return Response(
+                {'error': 'Upload-Offset header must be a non-negative integer'},
+                status=400)
+        length = header_int(request, 'Content-Length')
+        if length is None:
+            return Response(
+                {'error': 'Content-Length header must be a non-negative integer'},
+                status=400)
+        try:
+            # Read from the stream, never request.data: chunks are not parsed
+            upload = uploads.append(upload_id, request.user, offset,
+                                    request.stream or io.BytesIO(), length)
+        except uploads.UploadError as error:
+            current = ChatUpload.objects.filter(pk=upload_id, user=request.user).first()
+            body = {'error': str(error)}
+            if current is not None:
+                body.update(upload_state(current))
+            return Response(body, status=error.status)
+        return upload_response(upload)
+
+    upload = ChatUpload.objects.filter(pk=upload_id, user=request.user).first()
+    if upload is None:
+        return Response({'error': 'Upload not found'}, status=404)
+    if request.method == 'DELETE':
+        uploads.discard(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return upload_response(upload)